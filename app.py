@@ -1,74 +1,189 @@
+import startup
 import sys
-import html
-import json
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QTreeWidget, QTreeWidgetItem, QSlider, QStackedWidget, QComboBox, QCheckBox, QSizePolicy
+import threading
+from collections import OrderedDict
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QTreeView, QSlider, QStackedWidget, QComboBox, QCheckBox, QSizePolicy, QListWidget, QListWidgetItem, QMenu, QAbstractItemView, QPlainTextEdit, QFileDialog
 from PyQt5.QtGui import QIcon, QPixmap, QImage, QFont
-from PyQt5.QtCore import Qt, QTimer, QThread, QSize, pyqtSignal
-import requests
-import yt_dlp
-import vlc
-
-with open('config.json') as config_file:
-    config = json.load(config_file)
-    YOUTUBE_API_KEY = config.get('YOUTUBE_API_KEY')
-
-current_stream = None
-is_paused = False
-update_progress = False
-seeking = False
-
-class SearchThread(QThread):
-    search_results = pyqtSignal(list)
-
-    def __init__(self, query, filter_enabled):
-        QThread.__init__(self)
-        self.query = query
-        self.filter_enabled = filter_enabled
-
-    def run(self):
-        if self.filter_enabled:
-            url = f'https://www.googleapis.com/youtube/v3/search?part=snippet&type=video&maxResults=10&q={self.query}+music&key={YOUTUBE_API_KEY}'
-        else:
-            url = f'https://www.googleapis.com/youtube/v3/search?part=snippet&type=video&maxResults=35&q={self.query}&key={YOUTUBE_API_KEY}'
-        
-        response = requests.get(url)
-        data = response.json()
-        results = []
-        for item in data.get('items', []):
-            title = html.unescape(item['snippet']['title'])
-            if self.filter_enabled and not any(keyword in title.lower() for keyword in ['music', 'song', 'track', 'official video', 'lyrics']):
-                continue
-            video_id = item['id']['videoId']
-            thumbnail_url = item['snippet']['thumbnails']['high']['url']
-            results.append((title, video_id, thumbnail_url))
-        self.search_results.emit(results)
-
-class PlayerThread(QThread):
-    play_signal = pyqtSignal(str)
-
-    def __init__(self, video_id):
-        QThread.__init__(self)
-        self.video_id = video_id
-
-    def run(self):
-        global current_stream
-        try:
-            ydl_opts = {
-                'format': 'bestaudio',
-                'noplaylist': True,
-            }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info_dict = ydl.extract_info(f'https://www.youtube.com/watch?v={self.video_id}', download=False)
-                audio_url = info_dict['url']
-                song_title = info_dict['title']
-                current_stream = audio_url
-                self.play_signal.emit(song_title)
-        except Exception as e:
-            print(f"Error: {e}")
+from PyQt5.QtCore import Qt, QTimer, QObject, QSize, pyqtSignal, QAbstractTableModel, QModelIndex
+from engine import IMPORT_RESOLVE_AHEAD, Engine
+from prefetch import Prefetcher
+from thumbnails import ThumbnailDiskCache, load_thumbnail
+from downloads import DownloadManager
+from playlists import is_collection_url
+from metrics import PlaybackTimer, metrics
+from tasks import TaskScheduler
+from session import SessionStore, restored_playback, restored_search
+import net
+
+startup.mark('imports')
+
+PREFETCH_COUNT = 3
+# Upper bound on rows kept in the results view, however far the user scrolls
+MAX_RESULT_ROWS = 500
+THUMBNAIL_SIZE = 400
+PIXMAP_CACHE_BUDGET = 32 * 1024 * 1024
+# Seconds before the end of a track at which the next queued track is resolved and pre-buffered
+PRELOAD_SECONDS = 20
+DIAGNOSTICS_REFRESH_MS = 1000
+# Typing pauses this long before the local index is searched
+SEARCH_DEBOUNCE_MS = 250
+# Results kept in the session snapshot for the next launch
+SESSION_RESULTS = 100
+
+class ResultsModel(QAbstractTableModel):
+    more_requested = pyqtSignal(str)
+
+    headers = ['Title', 'Video ID']
 
-class YouTufyApp(QWidget):
     def __init__(self):
         super().__init__()
+        self.results = []
+        self.video_ids = set()
+        self.next_page_token = None
+        self.loading = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.results)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        result = self.results[index.row()]
+        if role == Qt.DisplayRole:
+            return result['title'] if index.column() == 0 else result['video_id']
+        if role == Qt.ToolTipRole:
+            if result.get('local'):
+                return f"{result['channel']} (played {result['play_count']} times)"
+            return result['channel']
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and bool(self.next_page_token) and not self.loading and len(self.results) < MAX_RESULT_ROWS
+
+    def fetchMore(self, parent=QModelIndex()):
+        # Called by the view as the user scrolls towards the last materialized row
+        self.loading = True
+        self.more_requested.emit(self.next_page_token)
+
+    def result(self, row):
+        return self.results[row]
+
+    def reset(self, page):
+        self.beginResetModel()
+        self.results = []
+        self.video_ids = set()
+        self.add_results(page['items'])
+        self.next_page_token = page['next_page_token']
+        self.loading = False
+        self.endResetModel()
+
+    def append(self, page):
+        results = [result for result in page['items'] if result['video_id'] not in self.video_ids][:MAX_RESULT_ROWS - len(self.results)]
+        if results:
+            self.beginInsertRows(QModelIndex(), len(self.results), len(self.results) + len(results) - 1)
+            self.add_results(results)
+            self.endInsertRows()
+        self.next_page_token = page['next_page_token']
+        self.loading = False
+
+    def add_results(self, results):
+        for result in results:
+            self.results.append(result)
+            self.video_ids.add(result['video_id'])
+
+    def loading_failed(self):
+        self.loading = False
+
+class DownloadSignals(QObject):
+    # DownloadManager reports from its worker threads; signals hand the updates to the GUI thread
+    progress = pyqtSignal(str, float)
+    finished = pyqtSignal(str, str)
+    failed = pyqtSignal(str, str)
+
+def load_thumbnail_image(video_id, fallback_url, disk_cache):
+    with metrics.timer('thumbnail'):
+        data = load_thumbnail(video_id, fallback_url, disk_cache)
+        if not data:
+            return None
+        # QImage decoding and scaling are safe off the GUI thread; QPixmap is not
+        image = QImage()
+        if not image.loadFromData(data):
+            return None
+        return image.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+class PixmapCache:
+    def __init__(self, max_bytes=PIXMAP_CACHE_BUDGET):
+        self.max_bytes = max_bytes
+        self.pixmaps = OrderedDict()
+        self.total_bytes = 0
+
+    def cost(self, pixmap):
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+    def get(self, video_id):
+        pixmap = self.pixmaps.get(video_id)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(video_id)
+        return pixmap
+
+    def put(self, video_id, pixmap):
+        old = self.pixmaps.pop(video_id, None)
+        if old is not None:
+            self.total_bytes -= self.cost(old)
+        self.pixmaps[video_id] = pixmap
+        self.total_bytes += self.cost(pixmap)
+        while self.total_bytes > self.max_bytes and len(self.pixmaps) > 1:
+            video_id, evicted = self.pixmaps.popitem(last=False)
+            self.total_bytes -= self.cost(evicted)
+
+class YouTufyApp(QWidget):
+    stream_error = pyqtSignal()
+    track_ended = pyqtSignal()
+    time_changed = pyqtSignal(int)
+    length_changed = pyqtSignal(int)
+    position_changed = pyqtSignal(float)
+    playback_started = pyqtSignal()
+    buffering_changed = pyqtSignal(float)
+
+    def __init__(self, engine):
+        super().__init__()
+        self.engine = engine
+        self.stream_cache = engine.stream_cache
+        self.search_cache = engine.search_cache
+        self.track_index = engine.track_index
+        self.library = engine.library
+        self.play_queue = engine.queue
+        self.local_results = []
+        self.displayed_page = None
+        self.search_key = None
+        self.session = SessionStore()
+        self.thumbnail_cache = ThumbnailDiskCache(index=self.session.get('thumbnails'))
+        self.pixmap_cache = PixmapCache()
+        self.tasks = TaskScheduler()
+        self.thumbnail_video_id = None
+        self.download_signals = DownloadSignals()
+        self.downloads = DownloadManager(self.library, self.download_signals.progress.emit, self.download_signals.finished.emit, self.download_signals.failed.emit)
+        self.download_progress = {}
+        self.prefetcher = Prefetcher(self.stream_cache, self.thumbnail_cache, self.library)
+        self.is_paused = False
+        self.seeking = False
+        self.preloaded_video_id = None
+        self.preloading_video_id = None
+        self.track_length = 0
+        self.playback_timer = PlaybackTimer()
+        self.resume_position = None
+        self.last_time_ms = 0
+        self.saved_second = None
+        # What is playing, which stays known after it is removed from the queue
+        self.current_track = None
         self.setWindowTitle('YouTufy')
         self.setWindowIcon(QIcon('assets/YouTufy.png'))
         self.setGeometry(100, 100, 1200, 800)
@@ -82,11 +197,11 @@ class YouTufyApp(QWidget):
                 color: white;
                 font-family: Roboto;
             }
-            QTreeWidget {
+            QTreeView {
                 background-color: #1c1c1c;
                 color: white;
             }
-            QTreeWidget::item {
+            QTreeView::item {
                 height: 25px;
             }
             QHeaderView::section {
@@ -117,11 +232,11 @@ class YouTufyApp(QWidget):
                 color: black;
                 font-family: Roboto;
             }
-            QTreeWidget {
+            QTreeView {
                 background-color: white;
                 color: black;
             }
-            QTreeWidget::item {
+            QTreeView::item {
                 height: 25px;
             }
             QHeaderView::section {
@@ -148,10 +263,12 @@ class YouTufyApp(QWidget):
         """
         
         self.initUI()
+        self.restore_session()
 
     def initUI(self):
         self.current_video_id = None
         self.pending_video_id = None
+        self.pending_title = None
 
         hbox_main = QHBoxLayout(self)
         
@@ -205,6 +322,8 @@ class YouTufyApp(QWidget):
         self.search_button.setFixedSize(50, 50)
         self.search_button.setStyleSheet("background: none; border: none;")
         self.search_button.clicked.connect(self.search_videos)
+        self.search_entry.returnPressed.connect(self.search_videos)
+        self.search_entry.textEdited.connect(lambda: self.tasks.debounce('typing', SEARCH_DEBOUNCE_MS, self.search_as_you_type))
 
         hbox_search.addStretch(1)
         hbox_search.addWidget(search_label)
@@ -215,16 +334,19 @@ class YouTufyApp(QWidget):
         self.home_layout.addLayout(hbox_search)
 
         # Results
-        self.results_tree = QTreeWidget()
-        self.results_tree.setColumnCount(2)
-        self.results_tree.setHeaderLabels(['Title', 'Video ID'])
+        self.results_model = ResultsModel()
+        self.results_model.more_requested.connect(self.load_more_results)
+        self.results_tree = QTreeView()
+        self.results_tree.setModel(self.results_model)
+        self.results_tree.setRootIsDecorated(False)
+        self.results_tree.setUniformRowHeights(True)
         self.results_tree.setColumnWidth(0, 400)
         self.results_tree.setStyleSheet("""
-            QTreeWidget {
+            QTreeView {
                 background-color: #1c1c1c;
                 color: white;
             }
-            QTreeWidget::item {
+            QTreeView::item {
                 height: 25px;
             }
             QHeaderView::section {
@@ -235,9 +357,43 @@ class YouTufyApp(QWidget):
                 border: none;
             }
         """)
-        self.results_tree.itemClicked.connect(self.select_song)
+        self.results_tree.clicked.connect(self.select_song)
+        # Warm up stream URLs and thumbnails for whatever row the user is looking at
+        self.results_tree.setMouseTracking(True)
+        self.results_tree.entered.connect(self.prefetch_item)
+        self.results_tree.selectionModel().currentChanged.connect(self.prefetch_item)
+        self.results_tree.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.results_tree.customContextMenuRequested.connect(self.show_results_menu)
+
+        hbox_lists = QHBoxLayout()
+        hbox_lists.addWidget(self.results_tree, 3)
+
+        # Queue
+        vbox_queue = QVBoxLayout()
+        vbox_queue.addWidget(QLabel('Up next:'))
+        self.queue_list = QListWidget()
+        self.queue_list.setDragDropMode(QAbstractItemView.InternalMove)
+        self.queue_list.itemDoubleClicked.connect(self.play_queue_item)
+        self.queue_list.model().rowsMoved.connect(self.queue_reordered)
+        self.queue_list.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.queue_list.customContextMenuRequested.connect(self.show_queue_menu)
+        vbox_queue.addWidget(self.queue_list)
 
-        self.home_layout.addWidget(self.results_tree)
+        hbox_queue_controls = QHBoxLayout()
+        self.shuffle_button = QPushButton('Shuffle')
+        self.shuffle_button.setCheckable(True)
+        self.shuffle_button.toggled.connect(self.set_shuffle)
+        self.repeat_button = QPushButton('Repeat: off')
+        self.repeat_button.clicked.connect(self.cycle_repeat)
+        self.next_button = QPushButton('Next')
+        self.next_button.clicked.connect(self.next_track)
+        hbox_queue_controls.addWidget(self.shuffle_button)
+        hbox_queue_controls.addWidget(self.repeat_button)
+        hbox_queue_controls.addWidget(self.next_button)
+        vbox_queue.addLayout(hbox_queue_controls)
+
+        hbox_lists.addLayout(vbox_queue, 1)
+        self.home_layout.addLayout(hbox_lists)
 
         # Thumbnail display
         self.thumbnail_label = QLabel()
@@ -249,6 +405,17 @@ class YouTufyApp(QWidget):
         self.currently_playing_label = QLabel('Currently playing: ')
         self.home_layout.addWidget(self.currently_playing_label)
 
+        # Downloads
+        self.downloads_label = QLabel('')
+        self.home_layout.addWidget(self.downloads_label)
+        self.download_signals.progress.connect(self.download_progressed)
+        self.download_signals.finished.connect(self.download_finished)
+        self.download_signals.failed.connect(self.download_failed)
+        for video_id in self.downloads.pending:
+            self.download_progress[video_id] = 0.0
+        self.downloads.start()
+        self.update_downloads_label()
+
         # Controls
         hbox_controls = QHBoxLayout()
         self.play_button = QPushButton()
@@ -288,10 +455,67 @@ class YouTufyApp(QWidget):
 
         self.home_layout.addLayout(hbox_time)
 
-        # Initialize VLC player
+        # VLC players are created after the window is shown; see init_player
+        self.vlc = None
+        self.instance = None
+        self.mediaplayer = None
+        self.standby_player = None
+        self.track_ended.connect(self.next_track)
+        self.stream_error.connect(self.stream_failed)
+        self.time_changed.connect(self.update_time)
+        self.length_changed.connect(self.update_length)
+        self.position_changed.connect(self.update_position)
+        self.playback_started.connect(self.playback_timer.started)
+        self.buffering_changed.connect(self.playback_timer.buffering)
+
+    def warm_up(self):
+        # Runs once the first frame is up: VLC must live on the GUI thread, the rest loads in the background
+        startup.mark('first paint')
+        self.init_player()
+        threading.Thread(target=self.warm_up_background, daemon=True).start()
+
+    def warm_up_background(self):
+        net.session()
+        startup.mark('http session ready')
+        self.engine.warm_extractors()
+        startup.mark('extractors warm')
+        if startup.enabled():
+            print(startup.report())
+
+    def init_player(self):
+        if self.mediaplayer is not None:
+            return
+        import vlc
+        self.vlc = vlc
+        # The standby player pre-buffers the next queued track
         self.instance = vlc.Instance()
         self.mediaplayer = self.instance.media_player_new()
-        self.mediaplayer.event_manager().event_attach(vlc.EventType.MediaPlayerEndReached, self.song_ended)
+        self.standby_player = self.instance.media_player_new()
+        self.mediaplayer.audio_set_volume(self.volume_slider.value())
+        for player in (self.mediaplayer, self.standby_player):
+            self.attach_player_events(player)
+        startup.mark('vlc ready')
+
+    def attach_player_events(self, player):
+        # VLC fires events on its own thread; only the active player's are relayed to the GUI thread
+        event_type = self.vlc.EventType
+        events = player.event_manager()
+        events.event_attach(event_type.MediaPlayerEndReached, self.relay_player_event, player, self.track_ended)
+        events.event_attach(event_type.MediaPlayerEncounteredError, self.relay_player_event, player, self.stream_error)
+        # Progress is pushed by VLC while playing instead of polled, so a paused or idle player costs nothing
+        events.event_attach(event_type.MediaPlayerTimeChanged, self.relay_player_event, player, self.time_changed, 'new_time')
+        events.event_attach(event_type.MediaPlayerLengthChanged, self.relay_player_event, player, self.length_changed, 'new_length')
+        events.event_attach(event_type.MediaPlayerPositionChanged, self.relay_player_event, player, self.position_changed, 'new_position')
+        events.event_attach(event_type.MediaPlayerPlaying, self.relay_player_event, player, self.playback_started)
+        events.event_attach(event_type.MediaPlayerBuffering, self.relay_player_event, player, self.buffering_changed, 'new_cache')
+
+    def relay_player_event(self, event, player, signal, field=None):
+        if player is not self.mediaplayer:
+            return
+        if field is None:
+            signal.emit()
+        else:
+            signal.emit(getattr(event.u, field))
 
     def init_settings_page(self):
         theme_label = QLabel("Select Theme:")
@@ -315,28 +539,112 @@ class YouTufyApp(QWidget):
         filter_label = QLabel("Enable Music Filter:")
         self.filter_checkbox = QCheckBox()
         self.filter_checkbox.setChecked(True)
+        self.filter_checkbox.toggled.connect(self.save_filter)
 
         self.settings_layout.addWidget(theme_label)
         self.settings_layout.addWidget(self.theme_dropdown)
         self.settings_layout.addWidget(filter_label)
         self.settings_layout.addWidget(self.filter_checkbox)
-        self.settings_layout.addStretch(1)
+
+        diagnostics_label = QLabel("Diagnostics:")
+        self.diagnostics_view = QPlainTextEdit()
+        self.diagnostics_view.setReadOnly(True)
+        self.diagnostics_view.setFont(QFont("Monospace", 9))
+        self.diagnostics_timer = QTimer(self)
+        self.diagnostics_timer.setInterval(DIAGNOSTICS_REFRESH_MS)
+        self.diagnostics_timer.timeout.connect(self.refresh_diagnostics)
+
+        hbox_export = QHBoxLayout()
+        export_json_button = QPushButton("Export JSON")
+        export_json_button.clicked.connect(lambda: self.export_metrics('JSON (*.json)', metrics.to_json))
+        export_prometheus_button = QPushButton("Export Prometheus")
+        export_prometheus_button.clicked.connect(lambda: self.export_metrics('Prometheus text (*.prom *.txt)', metrics.to_prometheus))
+        hbox_export.addWidget(export_json_button)
+        hbox_export.addWidget(export_prometheus_button)
+        hbox_export.addStretch(1)
+
+        self.settings_layout.addWidget(diagnostics_label)
+        self.settings_layout.addWidget(self.diagnostics_view, 1)
+        self.settings_layout.addLayout(hbox_export)
         
     def show_home(self):
+        self.diagnostics_timer.stop()
         self.stacked_widget.setCurrentWidget(self.home_page)
 
     def show_settings(self):
         self.stacked_widget.setCurrentWidget(self.settings_page)
+        # Only refreshed while the settings page is showing
+        self.refresh_diagnostics()
+        self.diagnostics_timer.start()
+
+    def refresh_diagnostics(self):
+        scrollbar = self.diagnostics_view.verticalScrollBar()
+        position = scrollbar.value()
+        self.diagnostics_view.setPlainText(metrics.report())
+        scrollbar.setValue(position)
+
+    def export_metrics(self, file_filter, render):
+        path, _ = QFileDialog.getSaveFileName(self, 'Export metrics', '', file_filter)
+        if not path:
+            return
+        with open(path, 'w') as export_file:
+            export_file.write(render())
         
+    def save_filter(self, enabled):
+        if self.engine.config.get('MUSIC_FILTER', True) != enabled:
+            self.engine.save_settings(MUSIC_FILTER=enabled)
+
+    def restore_session(self):
+        # Everything here is local, so the previous session is back before the window first paints
+        config = self.engine.config
+        self.theme_dropdown.setCurrentIndex(1 if config.get('THEME') == 'light' else 0)
+        self.filter_checkbox.setChecked(config.get('MUSIC_FILTER', True))
+        queue = self.session.get('queue')
+        if isinstance(queue, dict):
+            self.engine.restore_queue(queue)
+            self.shuffle_button.blockSignals(True)
+            self.shuffle_button.setChecked(self.play_queue.shuffle)
+            self.shuffle_button.blockSignals(False)
+            self.repeat_button.setText(f'Repeat: {self.play_queue.repeat}')
+            self.refresh_queue_list()
+        search = restored_search(self.session.get('search'))
+        if search is not None:
+            self.search_entry.setText(search['query'])
+            self.search_key = (search['query'], search['filter'])
+            self.results_model.reset(search['page'])
+        playback = restored_playback(self.session.get('playback'))
+        if playback is not None:
+            # Pressing play picks the last track up where it stopped
+            self.pending_video_id = playback['video_id']
+            self.pending_title = playback['title']
+            self.resume_position = (playback['video_id'], playback['position'])
+            self.currently_playing_label.setText(f"Last played: {playback['title']}")
+            self.play_button.setEnabled(True)
+            for result in self.results_model.results:
+                if result['video_id'] == playback['video_id']:
+                    self.show_thumbnail(result)
+                    break
+
+    def save_search(self):
+        query, filter_enabled = self.search_key
+        page = {'items': self.results_model.results[:SESSION_RESULTS], 'next_page_token': self.results_model.next_page_token}
+        self.session.update('search', {'query': query, 'filter': filter_enabled, 'page': page})
+
+    def save_queue(self):
+        self.session.update('queue', self.engine.queue_state())
+
     def change_theme(self, index):
+        theme = 'dark' if index == 0 else 'light'
+        if self.engine.config.get('THEME', 'dark') != theme:
+            self.engine.save_settings(THEME=theme)
         if index == 0:
             self.setStyleSheet(self.dark_theme_stylesheet)
             self.results_tree.setStyleSheet("""
-                QTreeWidget {
+                QTreeView {
                     background-color: #1c1c1c;
                     color: white;
                 }
-                QTreeWidget::item {
+                QTreeView::item {
                     height: 25px;
                 }
                 QHeaderView::section {
@@ -363,11 +671,11 @@ class YouTufyApp(QWidget):
         else:
             self.setStyleSheet(self.light_theme_stylesheet)
             self.results_tree.setStyleSheet("""
-                QTreeWidget {
+                QTreeView {
                     background-color: white;
                     color: black.
                 }
-                QTreeWidget::item {
+                QTreeView::item {
                     height: 25px.
                 }
                 QHeaderView::section {
@@ -418,113 +726,387 @@ class YouTufyApp(QWidget):
     def search_videos(self):
         query = self.search_entry.text()
         filter_enabled = self.filter_checkbox.isChecked()
-        self.search_thread = SearchThread(query, filter_enabled)
-        self.search_thread.search_results.connect(self.display_search_results)
-        self.search_thread.start()
-
-    def display_search_results(self, results):
-        self.results_tree.clear()
-        self.thumbnails = {}
-        for title, video_id, thumbnail_url in results:
-            item = QTreeWidgetItem([title, video_id])
-            self.results_tree.addTopLevelItem(item)
-            self.thumbnails[video_id] = thumbnail_url
-
-    def select_song(self, item):
-        video_id = item.text(1)
-        self.pending_video_id = video_id
-        self.show_thumbnail(item)
+        self.tasks.cancel('typing')
+        self.prefetcher.cancel()
+        self.search_key = key = (query, filter_enabled)
+        if is_collection_url(query):
+            # Its own channel, so a search typed meanwhile does not drop the import
+            self.tasks.submit('import', lambda: self.engine.import_collection(query, enqueue=False, resolve_ahead=False),
+                              lambda collection: self.display_collection(key, collection), self.import_failed)
+            return
+        # Tracks seen or played before are found locally and shown before any network round trip
+        self.local_results = self.track_index.search(query)
+        page, fresh = self.search_cache.get(query, filter_enabled)
+        if page is not None:
+            self.display_search_results(self.search_key, page)
+            # Near the day's quota limit stale pages are kept rather than revalidated
+            if fresh or self.engine.quota.low():
+                return
+        elif self.local_results:
+            self.displayed_page = None
+            self.results_model.reset({'items': self.local_results, 'next_page_token': None})
+        # Missing or stale: fetch (and revalidate) in the background; a newer search supersedes this one
+        self.tasks.submit('search', lambda: self.engine.fetch_page(query, filter_enabled), lambda page: self.display_search_results(key, page))
+
+    def search_as_you_type(self):
+        # Only the local index and cached pages while typing; the API is queried when the search is submitted
+        query = self.search_entry.text()
+        filter_enabled = self.filter_checkbox.isChecked()
+        if not query.strip() or is_collection_url(query):
+            return
+        self.tasks.cancel('search')
+        self.search_key = (query, filter_enabled)
+        self.local_results = self.track_index.search(query)
+        page, fresh = self.search_cache.get(query, filter_enabled)
+        if page is not None:
+            self.display_search_results(self.search_key, page)
+        elif self.local_results:
+            self.displayed_page = None
+            self.results_model.reset({'items': self.local_results, 'next_page_token': None})
+
+    def display_search_results(self, key, page):
+        if key != self.search_key or page == self.displayed_page:
+            return
+        self.displayed_page = page
+        self.track_index.add_results(page['items'])
+        local_ids = {result['video_id'] for result in self.local_results}
+        remote = [result for result in page['items'] if result['video_id'] not in local_ids]
+        self.results_model.reset({'items': self.local_results + remote, 'next_page_token': page['next_page_token']})
+        self.save_search()
+        for result in self.results_model.results[:PREFETCH_COUNT]:
+            self.prefetcher.schedule(result['video_id'], result['thumbnail_url'])
+
+    def display_collection(self, key, collection):
+        # The queue is only ever changed on this thread
+        for track in collection['tracks']:
+            self.play_queue.enqueue(track['video_id'], track['title'])
+        self.refresh_queue_list()
+        for track in collection['tracks'][:IMPORT_RESOLVE_AHEAD]:
+            self.prefetcher.schedule(track['video_id'], track['thumbnail_url'])
+        if key != self.search_key:
+            return
+        self.displayed_page = None
+        self.results_model.reset({'items': collection['tracks'], 'next_page_token': None})
+        self.save_search()
+
+    def import_failed(self, error):
+        self.currently_playing_label.setText(f'Could not import: {error}')
+
+    def load_more_results(self, page_token):
+        query, filter_enabled = self.search_key
+        page, fresh = self.search_cache.get(query, filter_enabled, page_token)
+        if fresh:
+            # Deferred so the view is not modified from inside its own fetchMore call
+            QTimer.singleShot(0, lambda key=self.search_key: self.append_search_results(key, page))
+            return
+        key = self.search_key
+        self.tasks.submit('page', lambda: self.engine.fetch_page(query, filter_enabled, page_token),
+                          lambda page: self.append_search_results(key, page), lambda error: self.results_model.loading_failed())
+
+    def append_search_results(self, key, page):
+        if key == self.search_key:
+            self.track_index.add_results(page['items'])
+            self.results_model.append(page)
+            self.save_search()
+
+    def prefetch_item(self, index):
+        if index.isValid():
+            result = self.results_model.result(index.row())
+            self.prefetcher.schedule(result['video_id'], result['thumbnail_url'])
+
+    def show_results_menu(self, position):
+        index = self.results_tree.indexAt(position)
+        if not index.isValid():
+            return
+        result = self.results_model.result(index.row())
+        menu = QMenu(self)
+        play_next_action = menu.addAction('Play next')
+        enqueue_action = menu.addAction('Add to queue')
+        download_action = menu.addAction('Downloaded' if result['video_id'] in self.library else 'Download')
+        download_action.setEnabled(result['video_id'] not in self.library and result['video_id'] not in self.download_progress)
+        action = menu.exec_(self.results_tree.viewport().mapToGlobal(position))
+        if action == play_next_action:
+            self.play_queue.play_next(result['video_id'], result['title'])
+        elif action == enqueue_action:
+            self.play_queue.enqueue(result['video_id'], result['title'])
+        elif action == download_action:
+            self.download(result['video_id'], result['title'])
+        self.refresh_queue_list()
+
+    def download(self, video_id, title):
+        if self.downloads.enqueue(video_id, title):
+            self.download_progress[video_id] = 0.0
+            self.update_downloads_label()
+
+    def download_progressed(self, video_id, percent):
+        self.download_progress[video_id] = percent
+        self.update_downloads_label()
+
+    def download_finished(self, video_id, path):
+        self.download_progress.pop(video_id, None)
+        self.track_index.mark_downloaded(video_id, self.library.get(video_id)['title'])
+        self.engine.analyze_loudness(video_id, path)
+        self.update_downloads_label()
+
+    def download_failed(self, video_id, error):
+        print(f"Download error: {error}")
+        self.download_progress.pop(video_id, None)
+        self.update_downloads_label()
+
+    def update_downloads_label(self):
+        if not self.download_progress:
+            self.downloads_label.setText('')
+            return
+        overall = sum(self.download_progress.values()) / len(self.download_progress)
+        self.downloads_label.setText(f'Downloading {len(self.download_progress)} track(s): {overall:.0f}%')
+
+    def show_queue_menu(self, position):
+        item = self.queue_list.itemAt(position)
+        if item is None:
+            return
+        menu = QMenu(self)
+        remove_action = menu.addAction('Remove')
+        if menu.exec_(self.queue_list.viewport().mapToGlobal(position)) == remove_action:
+            self.play_queue.remove(self.queue_list.row(item))
+            self.refresh_queue_list()
+
+    def refresh_queue_list(self):
+        self.queue_list.clear()
+        for position, (video_id, title) in enumerate(self.play_queue.tracks):
+            item = QListWidgetItem(title)
+            if position == self.play_queue.index and not self.play_queue.detached:
+                font = item.font()
+                font.setBold(True)
+                item.setFont(font)
+            self.queue_list.addItem(item)
+        self.save_queue()
+
+    def queue_reordered(self, parent, start, end, destination, row):
+        self.play_queue.move(start, row if row < start else row - 1)
+        QTimer.singleShot(0, self.refresh_queue_list)
+
+    def play_queue_item(self, item):
+        track = self.play_queue.jump(self.queue_list.row(item))
+        if track is not None:
+            self.current_video_id = track[0]
+            self.pending_video_id = None
+            self.refresh_queue_list()
+            self.play_selected_song()
+
+    def set_shuffle(self, enabled):
+        self.play_queue.set_shuffle(enabled)
+        self.refresh_queue_list()
+
+    def cycle_repeat(self):
+        self.repeat_button.setText(f'Repeat: {self.play_queue.cycle_repeat()}')
+        self.save_queue()
+
+    def select_song(self, index):
+        result = self.results_model.result(index.row())
+        self.pending_video_id = result['video_id']
+        self.pending_title = result['title']
+        self.show_thumbnail(result)
         self.play_button.setEnabled(True)  # Enable play button when a song is selected
 
-    def show_thumbnail(self, item):
-        video_id = item.text(1)
-        thumbnail_url = f'https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg'
-        try:
-            response = requests.get(thumbnail_url)
-            response.raise_for_status()
-        except requests.exceptions.RequestException:
-            thumbnail_url = self.thumbnails.get(video_id, None)
-        if thumbnail_url:
-            image = QImage()
-            image.loadFromData(requests.get(thumbnail_url).content)
-            self.thumbnail_label.setPixmap(QPixmap(image).scaled(400, 400, Qt.KeepAspectRatio))
-
-    def play_selected_song(self):
+    def show_thumbnail(self, result):
+        video_id = result['video_id']
+        self.thumbnail_video_id = video_id
+        pixmap = self.pixmap_cache.get(video_id)
+        metrics.cache_lookup('pixmap', pixmap is not None)
+        if pixmap is not None:
+            self.thumbnail_label.setPixmap(pixmap)
+            return
+        self.tasks.submit('thumbnail', lambda: load_thumbnail_image(video_id, result['thumbnail_url'], self.thumbnail_cache),
+                          lambda image: self.thumbnail_loaded(video_id, image))
+
+    def thumbnail_loaded(self, video_id, image):
+        if image is None:
+            return
+        pixmap = QPixmap.fromImage(image)
+        self.pixmap_cache.put(video_id, pixmap)
+        if video_id == self.thumbnail_video_id:
+            self.thumbnail_label.setPixmap(pixmap)
+
+    def play_selected_song(self, refresh=False):
         self.play_button.setEnabled(True)
-        self.player_thread = PlayerThread(self.current_video_id)
-        self.player_thread.play_signal.connect(self.play_audio)
-        self.player_thread.start()
+        self.init_player()
+        if not refresh:
+            self.last_time_ms = 0
+            self.saved_second = None
+            track = self.play_queue.current()
+            self.engine.track_started(self.current_video_id, track[1] if track else self.current_video_id)
+        self.reset_standby()
+        self.playback_timer.play_requested()
+        video_id = self.current_video_id
+        self.tasks.submit('play', lambda: self.engine.resolve(video_id, refresh),
+                          lambda entry: self.play_audio(entry['url'], entry['title']), self.play_failed)
 
-    def play_audio(self, song_title):
-        global is_paused, update_progress
+    def play_audio(self, stream_url, song_title):
+        self.current_track = (self.current_video_id, song_title)
         self.currently_playing_label.setText(f'Currently playing: {song_title}')
-        media = self.instance.media_new(current_stream)
-        self.mediaplayer.set_media(media)
+        options = []
+        if self.resume_position is not None and self.resume_position[0] == self.current_video_id:
+            options.append(f':start-time={self.resume_position[1] / 1000}')
+        self.resume_position = None
+        self.last_time_ms = 0
+        self.saved_second = None
+        self.engine.load_media(self.instance, self.mediaplayer, self.current_video_id, stream_url, *options)
+        self.mediaplayer.play()
+        self.is_paused = False
+        self.play_button.setIcon(QIcon('assets/pause_icon_dark.png' if self.theme_dropdown.currentIndex() == 0 else 'assets/pause_icon_light.png'))
+
+    def play_failed(self, error):
+        self.currently_playing_label.setText(f'Could not play: {error}')
+
+    def reset_standby(self):
+        self.preloaded_video_id = None
+        self.standby_player.stop()
+
+    def preload_next(self):
+        track = self.play_queue.peek_next()
+        if track is None or track[0] in (self.preloaded_video_id, self.preloading_video_id):
+            return
+        self.preloading_video_id = track[0]
+        video_id = track[0]
+        self.tasks.submit('preload', lambda: self.engine.resolve(video_id),
+                          lambda entry: self.prebuffer(video_id, entry['url']), lambda error: self.preload_failed(video_id))
+
+    def preload_failed(self, video_id):
+        if self.preloading_video_id == video_id:
+            self.preloading_video_id = None
+
+    def prebuffer(self, video_id, url):
+        self.preloading_video_id = None
+        track = self.play_queue.peek_next()
+        if track is None or track[0] != video_id:
+            return
+        # Opens the stream and fills the network buffer, then holds on the first frame
+        self.engine.load_media(self.instance, self.standby_player, video_id, url, ':start-paused')
+        self.standby_player.audio_set_mute(True)
+        self.standby_player.play()
+        self.preloaded_video_id = video_id
+
+    def next_track(self):
+        track = self.engine.advance()
+        self.refresh_queue_list()
+        if track is None:
+            self.play_button.setIcon(QIcon('assets/play_icon_dark.png' if self.theme_dropdown.currentIndex() == 0 else 'assets/play_icon_light.png'))
+            self.play_button.setEnabled(True)
+            return
+        video_id, title = track
+        self.current_video_id = video_id
+        self.pending_video_id = None
+        # Until the new track reports its time, the last one's position must not be saved under its id
+        self.last_time_ms = 0
+        self.saved_second = None
+        if self.preloaded_video_id != video_id:
+            self.play_selected_song()
+            return
+        self.engine.track_started(video_id, title)
+        self.current_track = track
+        self.mediaplayer, self.standby_player = self.standby_player, self.mediaplayer
+        self.preloaded_video_id = None
+        self.mediaplayer.audio_set_volume(self.volume_slider.value())
+        self.mediaplayer.audio_set_mute(False)
+        self.playback_timer.play_requested()
         self.mediaplayer.play()
-        is_paused = False
+        self.standby_player.stop()
+        # The standby player's LengthChanged fired while it was not the active one
+        self.update_length(self.mediaplayer.get_length())
+        self.is_paused = False
+        self.currently_playing_label.setText(f'Currently playing: {title}')
         self.play_button.setIcon(QIcon('assets/pause_icon_dark.png' if self.theme_dropdown.currentIndex() == 0 else 'assets/pause_icon_light.png'))
-        update_progress = True
-        self.update_progress_bar()
+
+    def stream_failed(self):
+        if self.current_video_id and self.engine.retry_stream(self.current_video_id):
+            self.play_selected_song(refresh=True)
 
     def toggle_play_pause(self):
-        global is_paused
         if self.current_video_id or self.pending_video_id:  # Ensure a song is selected before toggling play/pause
             if self.pending_video_id:
                 self.current_video_id = self.pending_video_id
+                current = self.play_queue.current()
+                # A restored session's last track is already the queue's current one
+                if current is None or current[0] != self.pending_video_id:
+                    self.play_queue.play_now(self.pending_video_id, self.pending_title or self.pending_video_id)
                 self.pending_video_id = None
+                self.refresh_queue_list()
                 self.play_selected_song()
             elif self.mediaplayer.is_playing():
                 self.mediaplayer.pause()
-                is_paused = True
+                self.is_paused = True
+                self.save_playback()
                 self.play_button.setIcon(QIcon('assets/play_icon_dark.png' if self.theme_dropdown.currentIndex() == 0 else 'assets.play_icon_light.png'))
             else:
                 self.mediaplayer.play()
-                is_paused = False
+                self.is_paused = False
                 self.play_button.setIcon(QIcon('assets/pause_icon_dark.png' if self.theme_dropdown.currentIndex() == 0 else 'assets/pause_icon_light.png'))
-                self.update_progress_bar()
 
     def set_volume(self, value):
-        self.mediaplayer.audio_set_volume(value)
+        if self.mediaplayer is not None:
+            self.mediaplayer.audio_set_volume(value)
 
     def start_seeking(self):
-        global seeking
-        seeking = True
+        self.seeking = True
 
     def seek_audio(self):
-        global seeking
-        if self.mediaplayer.is_playing() or is_paused:
-            seek_time = self.progress_bar.value() * self.mediaplayer.get_length() / 100
+        if self.mediaplayer is not None and (self.mediaplayer.is_playing() or self.is_paused):
+            seek_time = self.progress_bar.value() * self.track_length / 100
+            self.playback_timer.seeked()
             self.mediaplayer.set_time(int(seek_time))
-        seeking = False
-        self.update_progress_bar()
-
-    def update_progress_bar(self):
-        global update_progress, seeking
-        if update_progress and not seeking:
-            current_time = self.mediaplayer.get_time() / 1000
-            duration = self.mediaplayer.get_length() / 1000
-            if duration > 0:
-                progress = int((current_time / duration) * 100)
-                self.progress_bar.setValue(progress)
-                self.current_time_label.setText(self.format_time(current_time))
-                self.total_time_label.setText(self.format_time(duration))
-            QTimer.singleShot(500, self.update_progress_bar)  # Update more frequently for better accuracy
+        self.seeking = False
+
+    def update_time(self, time_ms):
+        if not self.seeking:
+            self.current_time_label.setText(self.format_time(time_ms / 1000))
+        self.last_time_ms = time_ms
+        # VLC reports several times a second; the snapshot only needs whole seconds
+        if time_ms // 1000 != self.saved_second:
+            self.save_playback()
+        if self.track_length > 0 and (self.track_length - time_ms) / 1000 < PRELOAD_SECONDS:
+            self.preload_next()
+
+    def save_playback(self):
+        self.saved_second = self.last_time_ms // 1000
+        track = self.play_queue.current()
+        if track is None or track[0] != self.current_video_id:
+            track = self.current_track
+        if track is not None and track[0] == self.current_video_id:
+            self.session.update('playback', {'video_id': track[0], 'title': track[1], 'position': self.last_time_ms})
+
+    def update_length(self, length_ms):
+        self.track_length = length_ms
+        self.total_time_label.setText(self.format_time(max(length_ms, 0) / 1000))
+
+    def update_position(self, position):
+        if not self.seeking:
+            self.progress_bar.setValue(int(position * 100))
 
     def format_time(self, seconds):
         minutes = int(seconds // 60)
         seconds = int(seconds % 60)
         return f'{minutes:02}:{seconds:02}'
 
-    def song_ended(self, event):
-        self.play_button.setIcon(QIcon('assets/play_icon_dark.png' if self.theme_dropdown.currentIndex() == 0 else 'assets/play_icon_light.png'))
-        self.play_button.setEnabled(True)
-
     def closeEvent(self, event):
-        self.mediaplayer.stop()
+        self.save_playback()
+        self.session.update('thumbnails', self.thumbnail_cache.index())
+        self.session.flush()
+        self.tasks.shutdown()
+        self.prefetcher.shutdown()
+        self.downloads.shutdown()
+        if self.mediaplayer is not None:
+            self.mediaplayer.stop()
+            self.standby_player.stop()
+        self.engine.close()
         event.accept()
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
-    ex = YouTufyApp()
+    startup.mark('qt application')
+    engine = Engine()
+    startup.mark('engine')
+    ex = YouTufyApp(engine)
+    startup.mark('window built')
     ex.show()
+    QTimer.singleShot(0, ex.warm_up)
     sys.exit(app.exec_())
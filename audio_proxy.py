@@ -0,0 +1,325 @@
+import os
+import re
+import shutil
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import net
+from disk_cache import DiskCache
+from metrics import metrics
+from storage import read_json, write_json
+
+SEGMENT_DIR = os.path.join('cache', 'audio')
+SEGMENT_DISK_BUDGET = 500 * 1024 * 1024
+SEGMENT_SIZE = 512 * 1024
+# Segments fetched past the one being read, so playback never waits on the network mid-track
+READ_AHEAD_SEGMENTS = 4
+READ_AHEAD_WORKERS = 2
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)')
+CONTENT_RANGE_PATTERN = re.compile(r'bytes \d+-\d+/(\d+)')
+
+
+class UpstreamExpired(Exception):
+    pass
+
+
+class StreamChanged(Exception):
+    pass
+
+
+def parse_range(header, size):
+    # (start, end, partial) for a Range header; None when the range cannot be satisfied.
+    # Headers that are missing or malformed, including reversed ranges, are ignored and the whole stream is sent.
+    match = RANGE_PATTERN.fullmatch((header or '').strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return 0, size - 1, False
+    if match.group(1):
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        if match.group(2) and int(match.group(2)) < start:
+            return 0, size - 1, False
+    else:
+        suffix = int(match.group(2))
+        if suffix == 0:
+            return None
+        start, end = max(0, size - suffix), size - 1
+    if start >= size:
+        return None
+    return start, end, True
+
+
+def stream_format(url):
+    # googlevideo URLs name their encoding; a re-resolved URL may point at a different one
+    itag = parse_qs(urlsplit(url).query).get('itag')
+    return itag[0] if itag else None
+
+
+class SegmentStore(DiskCache):
+    # Sparse on-disk copy of each stream: fixed-size segments keyed by (video, index)
+    def __init__(self, directory=SEGMENT_DIR, max_bytes=SEGMENT_DISK_BUDGET):
+        super().__init__(directory, max_bytes)
+        self.counts = Counter()
+        self.scan()
+
+    def files(self):
+        for key in os.listdir(self.directory):
+            stream_dir = self.stream_path(key)
+            if not os.path.isdir(stream_dir):
+                continue
+            segments = [name for name in os.listdir(stream_dir) if name.endswith('.seg')]
+            if not segments:
+                shutil.rmtree(stream_dir, ignore_errors=True)
+            for name in segments:
+                yield (key, int(name[:-4])), os.path.join(stream_dir, name)
+
+    def stream_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def path(self, segment):
+        key, index = segment
+        return os.path.join(self.stream_path(key), f'{index}.seg')
+
+    def added(self, segment):
+        self.counts[segment[0]] += 1
+
+    def removed(self, segment):
+        key = segment[0]
+        self.counts[key] -= 1
+        if self.counts[key]:
+            super().removed(segment)
+        else:
+            # Its info.json goes with the last segment
+            self.forget(key)
+
+    def info(self, key):
+        return read_json(os.path.join(self.stream_path(key), 'info.json'), None)
+
+    def set_info(self, key, size, content_type, itag=None):
+        write_json(os.path.join(self.stream_path(key), 'info.json'), {'size': size, 'content_type': content_type, 'itag': itag})
+
+    def forget(self, key):
+        # Caller holds the lock
+        del self.counts[key]
+        shutil.rmtree(self.stream_path(key), ignore_errors=True)
+
+    def drop(self, key):
+        # The stream's encoding changed, so none of its cached bytes line up with the new one
+        with self.lock:
+            for segment in [segment for segment in self.entries if segment[0] == key]:
+                self.total_bytes -= self.entries.pop(segment)
+            self.forget(key)
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def respond(self, send_body):
+        proxy = self.server.proxy
+        key = unquote(self.path.rpartition('/')[2])
+        try:
+            size, content_type = proxy.stream_info(key)
+        except KeyError:
+            self.send_error(404)
+            return
+        except Exception as e:
+            print(f"Audio proxy error: {e}")
+            self.send_error(502)
+            return
+        byte_range = parse_range(self.headers.get('Range'), size)
+        if byte_range is None:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        start, end, partial = byte_range
+        if partial:
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if not send_body:
+            return
+        try:
+            for chunk in proxy.read(key, start, end):
+                self.wfile.write(chunk)
+        except (ConnectionError, BrokenPipeError):
+            # VLC drops the connection whenever it seeks
+            pass
+        except Exception as e:
+            print(f"Audio proxy error: {e}")
+            self.close_connection = True
+
+
+class AudioProxy:
+    # Local HTTP server VLC streams from; byte ranges come from the segment store or, once, from upstream
+    def __init__(self, store=None, resolver=None, segment_size=SEGMENT_SIZE, read_ahead=READ_AHEAD_SEGMENTS):
+        self.store = store
+        self.resolver = resolver
+        self.segment_size = segment_size
+        self.read_ahead = read_ahead
+        self.lock = threading.Lock()
+        self.upstreams = {}
+        self.inflight = {}
+        self.queued = set()
+        self.executor = ThreadPoolExecutor(max_workers=READ_AHEAD_WORKERS, thread_name_prefix='audio-read-ahead')
+        self.server = None
+
+    def start(self):
+        with self.lock:
+            if self.server is None:
+                # The segment store scans its directory, so it is only opened once something plays
+                if self.store is None:
+                    self.store = SegmentStore()
+                self.server = ThreadingHTTPServer(('127.0.0.1', 0), ProxyHandler)
+                self.server.daemon_threads = True
+                self.server.proxy = self
+                threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def url_for(self, key, upstream_url):
+        self.start()
+        info = self.store.info(key)
+        if info is not None and info.get('itag') != stream_format(upstream_url):
+            self.store.drop(key)
+        with self.lock:
+            self.upstreams[key] = upstream_url
+        return f'http://127.0.0.1:{self.server.server_address[1]}/audio/{quote(key)}'
+
+    def upstream(self, key, refresh=False):
+        if refresh and self.resolver is not None:
+            # The signed URL expired mid-stream; cached segments stay valid for the new one
+            url = self.resolver(key)
+            with self.lock:
+                self.upstreams[key] = url
+            return url
+        with self.lock:
+            return self.upstreams[key]
+
+    def verify(self, key, url, size, content_type):
+        # Cached ranges only fit a response of the same encoding; otherwise the stream starts over
+        info = self.store.info(key)
+        if info is None:
+            return
+        if (info['size'], info['content_type'], info.get('itag')) != (size, content_type, stream_format(url)):
+            self.store.drop(key)
+            raise StreamChanged(f'{key} changed encoding upstream')
+
+    def fetch_upstream(self, key, first, last):
+        for refresh in (False, True):
+            url = self.upstream(key, refresh)
+            response = net.get(url, headers={'Range': f'bytes={first}-{last}'})
+            if response.status_code not in (401, 403, 404, 410):
+                break
+        content_type = response.headers.get('Content-Type', 'application/octet-stream')
+        if response.status_code == 200:
+            # Upstream ignored the range and sent the whole stream; keep all of it
+            content = response.content
+            self.verify(key, url, len(content), content_type)
+            for index in range(0, len(content), self.segment_size):
+                self.store.put((key, index // self.segment_size), content[index:index + self.segment_size])
+            self.store.set_info(key, len(content), content_type, stream_format(url))
+            return content[first:last + 1], response, url
+        if response.status_code != 206:
+            raise UpstreamExpired(f'upstream answered {response.status_code}')
+        match = CONTENT_RANGE_PATTERN.match(response.headers.get('Content-Range', ''))
+        self.verify(key, url, int(match.group(1)) if match else None, content_type)
+        return response.content, response, url
+
+    def stream_info(self, key):
+        info = self.store.info(key)
+        if info is not None:
+            return info['size'], info['content_type']
+        with self.lock:
+            if key not in self.upstreams:
+                raise KeyError(key)
+        data, response, url = self.fetch_upstream(key, 0, self.segment_size - 1)
+        match = CONTENT_RANGE_PATTERN.match(response.headers.get('Content-Range', ''))
+        size = int(match.group(1)) if match else len(data)
+        content_type = response.headers.get('Content-Type', 'application/octet-stream')
+        self.store.put((key, 0), data)
+        self.store.set_info(key, size, content_type, stream_format(url))
+        return size, content_type
+
+    def segment(self, key, index):
+        data = self.store.get((key, index))
+        metrics.cache_lookup('audio_segment', data is not None)
+        if data is not None:
+            return data
+        # Concurrent readers of the same segment (playback and read-ahead) share one upstream request
+        with self.lock:
+            event = self.inflight.get((key, index))
+            owner = event is None
+            if owner:
+                event = self.inflight[(key, index)] = threading.Event()
+        if not owner:
+            event.wait()
+            data = self.store.get((key, index))
+            if data is not None:
+                return data
+            return self.segment(key, index)
+        try:
+            size, _ = self.stream_info(key)
+            first = index * self.segment_size
+            with metrics.timer('audio_segment_fetch'):
+                data, _, _ = self.fetch_upstream(key, first, min(first + self.segment_size, size) - 1)
+            self.store.put((key, index), data)
+            return data
+        finally:
+            with self.lock:
+                del self.inflight[(key, index)]
+            event.set()
+
+    def fetch_ahead(self, key, index):
+        with self.lock:
+            self.queued.discard((key, index))
+        self.segment(key, index)
+
+    def prefetch(self, key, first_index, last_index):
+        for index in range(first_index, last_index + 1):
+            if (key, index) not in self.store:
+                with self.lock:
+                    # Already being fetched, or waiting for a read-ahead worker
+                    if (key, index) in self.inflight or (key, index) in self.queued:
+                        continue
+                    self.queued.add((key, index))
+                self.executor.submit(self.fetch_ahead, key, index)
+
+    def read(self, key, start, end):
+        size, _ = self.stream_info(key)
+        last_segment = (size - 1) // self.segment_size
+        index = start // self.segment_size
+        while start <= end:
+            self.prefetch(key, index + 1, min(index + self.read_ahead, last_segment))
+            data = self.segment(key, index)
+            offset = start - index * self.segment_size
+            chunk = data[offset:offset + end - start + 1]
+            if not chunk:
+                return
+            yield chunk
+            start += len(chunk)
+            index += 1
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self.lock:
+            server, self.server = self.server, None
+        if server is not None:
+            server.shutdown()
+            server.server_close()
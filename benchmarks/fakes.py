@@ -0,0 +1,182 @@
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+AUDIO_SECONDS = 5
+SAMPLE_RATE = 22050
+PAGES_PER_QUERY = 5
+
+
+def video_id_for(seed):
+    return hashlib.sha1(seed.encode()).hexdigest()[:11]
+
+
+def silent_wav(seconds=AUDIO_SECONDS, sample_rate=SAMPLE_RATE):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(b'\0\0' * seconds * sample_rate)
+    return buffer.getvalue()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.server.count(url.path)
+        self.server.delay()
+        if url.path == '/youtube/v3/search':
+            self.send_json(self.server.search_response(params))
+        elif url.path == '/youtube/v3/videos':
+            self.send_json(self.server.videos_response(params))
+        elif url.path.startswith('/vi/') and self.server.thumbnail:
+            self.send_body(self.server.thumbnail, 'image/jpeg')
+        elif url.path.startswith('/audio/'):
+            self.send_body(self.server.audio, 'audio/wav')
+        else:
+            self.send_error(404)
+
+    def send_json(self, data):
+        self.send_body(json.dumps(data).encode(), 'application/json')
+
+    def send_body(self, body, content_type):
+        start, end = 0, len(body) - 1
+        byte_range = self.headers.get('Range', '')
+        if byte_range.startswith('bytes='):
+            first, _, last = byte_range[6:].partition('-')
+            start = int(first or 0)
+            end = min(int(last), end) if last else end
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        if byte_range:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(body)}')
+        self.end_headers()
+        self.wfile.write(body[start:end + 1])
+
+
+class StandInServer(ThreadingHTTPServer):
+    # Serves the YouTube Data API, i.ytimg.com thumbnails and media on localhost, with adjustable latency
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, jitter=0.0, thumbnail=None, recordings=None, port=0):
+        super().__init__(('127.0.0.1', port), StandInHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.thumbnail = thumbnail
+        self.audio = silent_wav()
+        self.recordings = recordings
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.thread = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, path):
+        kind = path.split('/')[-1] if path.startswith('/youtube/') else path.split('/')[1]
+        with self.lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    def delay(self):
+        seconds = self.latency + random.uniform(0, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def recorded(self, query, page_token):
+        # Recorded responses are looked up as <query>[.<page token>].json, with spaces as underscores
+        if not self.recordings:
+            return None
+        name = query.replace(' ', '_') + (f'.{page_token}' if page_token else '') + '.json'
+        try:
+            with open(os.path.join(self.recordings, name)) as recording:
+                return json.load(recording)
+        except (OSError, ValueError):
+            return None
+
+    def search_response(self, params):
+        query = params.get('q', '')
+        page_token = params.get('pageToken')
+        recorded = self.recorded(query, page_token)
+        if recorded is not None:
+            return recorded
+        page = int(page_token or 0)
+        size = int(params.get('maxResults', 5))
+        items = []
+        for position in range(page * size, (page + 1) * size):
+            video_id = video_id_for(f'{query}:{position}')
+            items.append({
+                'kind': 'youtube#searchResult',
+                'id': {'kind': 'youtube#video', 'videoId': video_id},
+                'snippet': {
+                    'title': f'{query} - track {position} (official video)',
+                    'channelTitle': 'Stand-in Channel',
+                    'thumbnails': {'high': {'url': f'{self.url}/vi/{video_id}/hqdefault.jpg', 'width': 480, 'height': 360}},
+                },
+            })
+        response = {'kind': 'youtube#searchListResponse', 'pageInfo': {'totalResults': PAGES_PER_QUERY * size, 'resultsPerPage': size}, 'items': items}
+        if page + 1 < PAGES_PER_QUERY:
+            response['nextPageToken'] = str(page + 1)
+        return response
+
+    def videos_response(self, params):
+        items = []
+        for video_id in params.get('id', '').split(','):
+            if video_id:
+                items.append({
+                    'id': video_id,
+                    'snippet': {
+                        'title': f'Stand-in track {video_id}',
+                        'channelTitle': 'Stand-in Channel',
+                        'thumbnails': {'high': {'url': f'{self.url}/vi/{video_id}/hqdefault.jpg'}},
+                    },
+                    'contentDetails': {'duration': f'PT{AUDIO_SECONDS}S'},
+                })
+        return {'kind': 'youtube#videoListResponse', 'items': items}
+
+
+class FakeYoutubeDL:
+    # Stands in for yt_dlp.YoutubeDL: resolves to a stream on the stand-in server after a fixed extraction delay
+    def __init__(self, server_url, latency, options=None):
+        self.server_url = server_url
+        self.latency = latency
+        self.options = options or {}
+
+    def extract_info(self, url, download=False):
+        video_id = parse_qs(urlparse(url).query)['v'][0]
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return {
+            'id': video_id,
+            'title': f'Stand-in track {video_id}',
+            'duration': AUDIO_SECONDS,
+            'url': f'{self.server_url}/audio/{video_id}.wav',
+        }
+
+    def close(self):
+        pass
@@ -0,0 +1,266 @@
+import argparse
+import functools
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+if not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import QBuffer, QEventLoop, QObject, QIODevice, QTimer
+from PyQt5.QtGui import QColor, QImage
+from PyQt5.QtWidgets import QApplication
+
+import app as youtufy_app
+import streams
+from benchmarks.fakes import FakeYoutubeDL, StandInServer
+from engine import Engine
+
+STALL_INTERVAL_MS = 10
+# Event loop delays above this are reported as stalls; one frame at 60 Hz is ~17 ms
+STALL_THRESHOLD_MS = 50
+WAIT_TIMEOUT = 30
+
+
+def thumbnail_jpeg(width=1280, height=720):
+    image = QImage(width, height, QImage.Format_RGB32)
+    image.fill(QColor('#336699'))
+    buffer = QBuffer()
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, 'JPEG', 90)
+    return bytes(buffer.data())
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def summarize(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    pick = lambda fraction: ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    return {
+        'count': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+        'p50_ms': pick(0.5) * 1000,
+        'p95_ms': pick(0.95) * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+class StallMonitor(QObject):
+    # A short repeating timer; any lateness beyond its interval is time the event loop spent blocked
+    def __init__(self, interval_ms=STALL_INTERVAL_MS, threshold_ms=STALL_THRESHOLD_MS):
+        super().__init__()
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.tick)
+        self.last = None
+        self.lags = []
+
+    def start(self):
+        self.lags = []
+        self.last = time.perf_counter()
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        stalls = [lag for lag in self.lags if lag > self.threshold]
+        return {'ticks': len(self.lags), 'stalls': len(stalls), 'max_lag_ms': max(self.lags, default=0) * 1000, 'stalled_ms': sum(stalls) * 1000}
+
+    def tick(self):
+        now = time.perf_counter()
+        self.lags.append(max(0.0, now - self.last - self.interval))
+        self.last = now
+
+
+class Harness:
+    def __init__(self, qt_app, server, window):
+        self.qt_app = qt_app
+        self.server = server
+        self.window = window
+        self.monitor = StallMonitor()
+        self.query_count = 0
+
+    def wait_until(self, predicate, timeout=WAIT_TIMEOUT):
+        start = time.perf_counter()
+        while not predicate():
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError('timed out waiting for the UI')
+            self.qt_app.processEvents(QEventLoop.AllEvents, 5)
+            time.sleep(0.0005)
+        return time.perf_counter() - start
+
+    def scenario(self, run, *args):
+        self.monitor.start()
+        result = run(*args)
+        result['event_loop'] = self.monitor.stop()
+        return result
+
+    def next_query(self):
+        self.query_count += 1
+        return f'benchmark query {self.query_count}'
+
+    def search(self, query):
+        window = self.window
+        previous = window.displayed_page
+        window.search_entry.setText(query)
+        start = time.perf_counter()
+        window.search_videos()
+        self.wait_until(lambda: window.displayed_page is not None and window.displayed_page is not previous)
+        return time.perf_counter() - start
+
+    def search_to_render(self, queries):
+        queries = [self.next_query() for _ in range(queries)]
+        cold = [self.search(query) for query in queries]
+        # The same queries again, now served from the search cache
+        warm = [self.search(query) for query in queries]
+        return {'cold': summarize(cold), 'cached': summarize(warm)}
+
+    def thumbnail_display(self, rows):
+        window = self.window
+        self.search(self.next_query())
+        model = window.results_model
+        # Rows past the prefetched ones, so the first pass really goes to the network
+        indexes = [model.index(row, 0) for row in range(youtufy_app.PREFETCH_COUNT, min(model.rowCount(), youtufy_app.PREFETCH_COUNT + rows))]
+        timings = {}
+        for tier in ('network', 'disk', 'memory'):
+            if tier == 'disk':
+                window.pixmap_cache = youtufy_app.PixmapCache()
+            samples = []
+            for index in indexes:
+                video_id = model.result(index.row())['video_id']
+                start = time.perf_counter()
+                window.select_song(index)
+                self.wait_until(lambda: window.pixmap_cache.get(video_id) is not None)
+                samples.append(time.perf_counter() - start)
+            timings[tier] = summarize(samples)
+        return timings
+
+    def click_to_audio(self, clicks, vlc_available):
+        window = self.window
+        self.search(self.next_query())
+        model = window.results_model
+        samples = []
+        for row in range(min(clicks, model.rowCount())):
+            result = model.result(row)
+            if vlc_available:
+                window.select_song(model.index(row, 0))
+                start = time.perf_counter()
+                window.toggle_play_pause()
+                self.wait_until(lambda: window.playback_timer.requested is None)
+            else:
+                # Without libvlc only the part up to a playable stream URL can be timed
+                ready = []
+                start = time.perf_counter()
+                window.tasks.submit('play', lambda video_id=result['video_id']: window.engine.resolve(video_id), ready.append)
+                self.wait_until(lambda: bool(ready))
+            samples.append(time.perf_counter() - start)
+        if vlc_available and window.mediaplayer is not None:
+            window.mediaplayer.stop()
+        return {'measured_until': 'first audio' if vlc_available else 'stream url', 'timings': summarize(samples)}
+
+    def memory_growth(self, searches, sample_every):
+        latency, self.server.latency = self.server.latency, 0.0
+        gc.collect()
+        tracemalloc.start()
+        baseline_rss = rss_bytes()
+        baseline_heap = tracemalloc.get_traced_memory()[0]
+        samples = []
+        for count in range(1, searches + 1):
+            self.search(self.next_query())
+            if count % sample_every == 0 or count == searches:
+                gc.collect()
+                samples.append({'searches': count, 'rss_mb': rss_bytes() / 2 ** 20, 'python_heap_mb': tracemalloc.get_traced_memory()[0] / 2 ** 20})
+        tracemalloc.stop()
+        self.server.latency = latency
+        return {
+            'searches': searches,
+            'rss_growth_mb': (rss_bytes() - baseline_rss) / 2 ** 20,
+            'python_heap_growth_mb': samples[-1]['python_heap_mb'] - baseline_heap / 2 ** 20,
+            'samples': samples,
+        }
+
+
+def vlc_usable():
+    try:
+        import vlc
+        return vlc.Instance('--no-video') is not None
+    except Exception:
+        return False
+
+
+def print_report(results):
+    for name, result in results.items():
+        if name == 'config':
+            continue
+        print(f'\n{name}')
+        print(json.dumps(result, indent=2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmarks.run', description='Offline YouTufy benchmarks against local stand-ins')
+    parser.add_argument('--latency', type=float, default=0.08, help='seconds added to every stand-in HTTP response')
+    parser.add_argument('--jitter', type=float, default=0.02, help='random extra latency, up to this many seconds')
+    parser.add_argument('--extract-latency', type=float, default=0.4, help='seconds the fake extractor takes per video')
+    parser.add_argument('--recordings', help='directory of recorded search.list responses to serve instead of generated ones')
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--thumbnails', type=int, default=5)
+    parser.add_argument('--clicks', type=int, default=5)
+    parser.add_argument('--searches', type=int, default=1000, help='searches run for the memory growth measurement')
+    parser.add_argument('--json', help='also write the results to this file')
+    options = parser.parse_args(argv)
+
+    qt_app = QApplication.instance() or QApplication(sys.argv[:1])
+    server = StandInServer(options.latency, options.jitter, thumbnail_jpeg(), options.recordings).start()
+    streams.configure_extractors(factory=functools.partial(FakeYoutubeDL, server.url, options.extract_latency))
+    vlc_available = vlc_usable()
+    # Caches are written relative to the working directory; keep them out of the checkout
+    checkout = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='youtufy-bench-')
+    os.chdir(workdir)
+    config = {
+        'YOUTUBE_API_KEY': 'benchmark',
+        'YOUTUBE_API_URL': f'{server.url}/youtube/v3',
+        'THUMBNAIL_URL': f'{server.url}/vi/{{video_id}}/maxresdefault.jpg',
+        'NORMALIZE_LOUDNESS': False,
+        # The memory run alone would spend a real key's quota many times over
+        'DAILY_QUOTA': 10 ** 9,
+    }
+    window = youtufy_app.YouTufyApp(Engine(config))
+    window.show()
+    if vlc_available:
+        window.init_player()
+    harness = Harness(qt_app, server, window)
+    results = {'config': dict(vars(options), vlc_available=vlc_available, workdir=workdir)}
+    try:
+        results['search_to_render'] = harness.scenario(harness.search_to_render, options.queries)
+        results['thumbnail_display'] = harness.scenario(harness.thumbnail_display, options.thumbnails)
+        results['click_to_audio'] = harness.scenario(harness.click_to_audio, options.clicks, vlc_available)
+        results['memory_growth'] = harness.scenario(harness.memory_growth, options.searches, max(1, options.searches // 10))
+        results['server_requests'] = dict(server.requests)
+    finally:
+        window.close()
+        server.stop()
+        os.chdir(checkout)
+    print_report(results)
+    if options.json:
+        with open(options.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import os
+import threading
+from collections import OrderedDict
+
+from storage import write_file
+
+
+class DiskCache:
+    # Files under one directory, kept within a byte budget and evicted least recently used first.
+    # Subclasses map keys to paths and list the files already on disk.
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+
+    def path(self, key):
+        raise NotImplementedError
+
+    def files(self):
+        # (key, path) for every cached file in the directory
+        raise NotImplementedError
+
+    def scan(self):
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for key, path in self.files():
+            stat = os.stat(path)
+            files.append((stat.st_mtime, key, stat.st_size))
+        # Oldest first, so eviction pops from the front
+        for mtime, key, size in sorted(files):
+            self.entries[key] = size
+            self.added(key)
+            self.total_bytes += size
+
+    def added(self, key):
+        # Called with the lock held when a key enters the cache
+        pass
+
+    def removed(self, key):
+        # Called with the lock held when a key leaves the cache
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            try:
+                with open(self.path(key), 'rb') as cached_file:
+                    data = cached_file.read()
+                os.utime(self.path(key))
+            except OSError:
+                self.total_bytes -= self.entries.pop(key)
+                self.removed(key)
+                return None
+            self.entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self.lock:
+            write_file(self.path(key), data)
+            previous = self.entries.pop(key, None)
+            if previous is None:
+                self.added(key)
+            self.total_bytes += len(data) - (previous or 0)
+            self.entries[key] = len(data)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                oldest, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                self.removed(oldest)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
@@ -0,0 +1,122 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import read_json, write_json
+
+DOWNLOAD_DIR = 'downloads'
+LIBRARY_FILE = os.path.join(DOWNLOAD_DIR, 'library.json')
+DOWNLOAD_QUEUE_FILE = os.path.join('cache', 'downloads.json')
+DOWNLOAD_WORKERS = 2
+
+
+class Library:
+    def __init__(self, path=LIBRARY_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.tracks = read_json(path, {})
+
+    def get(self, video_id):
+        with self.lock:
+            track = self.tracks.get(video_id)
+            if track is None:
+                return None
+            if not os.path.exists(track['path']):
+                del self.tracks[video_id]
+                write_json(self.path, self.tracks)
+                return None
+            return track
+
+    def add(self, video_id, title, path):
+        with self.lock:
+            self.tracks[video_id] = {'title': title, 'path': path}
+            write_json(self.path, self.tracks)
+
+    def __contains__(self, video_id):
+        return self.get(video_id) is not None
+
+
+class DownloadManager:
+    def __init__(self, library, on_progress=None, on_finished=None, on_failed=None,
+                 directory=DOWNLOAD_DIR, queue_path=DOWNLOAD_QUEUE_FILE, max_workers=DOWNLOAD_WORKERS):
+        self.library = library
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.on_failed = on_failed
+        self.directory = directory
+        self.queue_path = queue_path
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='download')
+        self.lock = threading.Lock()
+        self.pending = OrderedDict(read_json(queue_path, []))
+        self.stopping = False
+
+    def start(self):
+        # Picks up downloads left over from the previous run; yt-dlp resumes their .part files
+        with self.lock:
+            pending = list(self.pending.items())
+        for video_id, title in pending:
+            self.executor.submit(self.download, video_id, title)
+
+    def enqueue(self, video_id, title):
+        with self.lock:
+            if video_id in self.pending or video_id in self.library:
+                return False
+            self.pending[video_id] = title
+            self.save_queue()
+        self.executor.submit(self.download, video_id, title)
+        return True
+
+    def save_queue(self):
+        write_json(self.queue_path, list(self.pending.items()))
+
+    def download(self, video_id, title):
+        if self.stopping:
+            return
+        import yt_dlp
+        from yt_dlp.utils import DownloadCancelled
+        ydl_opts = {
+            'format': 'bestaudio',
+            'noplaylist': True,
+            'outtmpl': os.path.join(self.directory, '%(id)s.%(ext)s'),
+            'continuedl': True,
+            'quiet': True,
+            'noprogress': True,
+            'progress_hooks': [lambda status: self.progress(video_id, status)],
+        }
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                info_dict = ydl.extract_info(f'https://www.youtube.com/watch?v={video_id}', download=True)
+                downloads = info_dict.get('requested_downloads') or [{}]
+                path = downloads[0].get('filepath') or ydl.prepare_filename(info_dict)
+        except DownloadCancelled:
+            return
+        except Exception as e:
+            # Dropped from the queue so it can be retried, and not retried on every launch
+            with self.lock:
+                self.pending.pop(video_id, None)
+                self.save_queue()
+            if self.on_failed:
+                self.on_failed(video_id, str(e))
+            return
+        self.library.add(video_id, info_dict.get('title', title), path)
+        with self.lock:
+            self.pending.pop(video_id, None)
+            self.save_queue()
+        if self.on_finished:
+            self.on_finished(video_id, path)
+
+    def progress(self, video_id, status):
+        if self.stopping:
+            # Aborts the transfer but leaves the .part file behind for the next run
+            from yt_dlp.utils import DownloadCancelled
+            raise DownloadCancelled()
+        if status['status'] != 'downloading' or not self.on_progress:
+            return
+        total = status.get('total_bytes') or status.get('total_bytes_estimate')
+        if total:
+            self.on_progress(video_id, 100.0 * status.get('downloaded_bytes', 0) / total)
+
+    def shutdown(self):
+        self.stopping = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,307 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import loudness
+import net
+import playlists
+import settings
+import streams
+import thumbnails
+import youtube
+from audio_proxy import AudioProxy
+from downloads import Library
+from metrics import PlaybackTimer, metrics
+from playqueue import REPEAT_MODES, REPEAT_OFF, PlayQueue
+from quota import DAILY_QUOTA, QuotaBudget, QuotaExhausted
+from search_cache import SearchCache
+from streams import StreamCache, resolve, resolve_many
+from track_index import TrackIndex
+
+# Imported tracks resolved up front; the rest resolve when prefetched or played, before their URLs could expire
+IMPORT_RESOLVE_AHEAD = 10
+
+
+class Engine:
+    def __init__(self, config=None):
+        # Settings changed in the window are only written back when they came from config.json
+        self.config_file = config is None
+        self.config = config if config is not None else settings.load_config()
+        self.api_key = self.config.get('YOUTUBE_API_KEY')
+        net.configure(self.config.get('HTTP_CONNECT_TIMEOUT'), self.config.get('HTTP_READ_TIMEOUT'), self.config.get('HTTP_RETRIES'))
+        streams.configure_extractors(self.config.get('EXTRACTOR_POOL_SIZE'), self.config.get('EXTRACTOR_PROCESSES'))
+        youtube.configure(self.config.get('YOUTUBE_API_URL'))
+        thumbnails.configure(self.config.get('THUMBNAIL_URL'))
+        self.stream_cache = StreamCache()
+        self.search_cache = SearchCache()
+        self.quota = QuotaBudget(daily_limit=self.config.get('DAILY_QUOTA', DAILY_QUOTA))
+        # Durations and categories are looked up after a page is shown, never in front of it
+        self.details = ThreadPoolExecutor(max_workers=1, thread_name_prefix='video-details')
+        # Imported tracks resolved ahead of playback, one batch at a time
+        self.resolve_ahead = ThreadPoolExecutor(max_workers=1, thread_name_prefix='resolve-ahead')
+        self.library = Library()
+        self.track_index = TrackIndex()
+        self.queue = PlayQueue()
+        self.loudness = loudness.LoudnessAnalyzer(self.track_index, self.config.get('LOUDNESS_TARGET', loudness.TARGET_LUFS), self.config.get('NORMALIZE_LOUDNESS', True))
+        self.lock = threading.RLock()
+        self.instance = None
+        self.player = None
+        self.volume = 50
+        self.stream_retried = False
+        self.playback_timer = PlaybackTimer()
+        self.audio_proxy = AudioProxy(resolver=lambda video_id: self.resolve(video_id, refresh=True)['url']) if self.config.get('AUDIO_PROXY', True) else None
+        # libvlc must not be called back from inside its own event callbacks
+        self.events = ThreadPoolExecutor(max_workers=1, thread_name_prefix='engine-events')
+
+    def load_page(self, query, filter_enabled, page_token):
+        page = youtube.search(self.api_key, query, filter_enabled, page_token, self.quota)
+        self.submit(self.details, self.add_details, page['items'])
+        return page
+
+    def submit(self, executor, work, *args):
+        try:
+            executor.submit(work, *args)
+        except RuntimeError:
+            # Searches still in flight when the engine closes skip their background follow-up
+            pass
+
+    def add_details(self, results):
+        # One videos.list unit per page; the index then has durations for local results
+        try:
+            details = youtube.videos(self.api_key, [result['video_id'] for result in results], self.quota)
+        except Exception as e:
+            print(f"Error: {e}")
+            return
+        self.track_index.add_results([dict(result, **details[result['video_id']]) for result in results if result['video_id'] in details])
+
+    def fetch_page(self, query, filter_enabled=True, page_token=None):
+        try:
+            return self.search_cache.fetch(query, filter_enabled, lambda: self.load_page(query, filter_enabled, page_token), page_token)
+        except QuotaExhausted as e:
+            print(f"Error: {e}")
+        # Out of quota for now: a stale page if there is one, otherwise whatever the local index knows
+        page, fresh = self.search_cache.get(query, filter_enabled, page_token)
+        if page is not None:
+            return page
+        return {'items': [] if page_token else self.track_index.search(query), 'next_page_token': None}
+
+    def search(self, query, filter_enabled=True, page_token=None):
+        page, fresh = self.search_cache.get(query, filter_enabled, page_token)
+        # Near the day's quota limit stale pages are served as they are
+        if page is None or not (fresh or self.quota.low()):
+            page = self.fetch_page(query, filter_enabled, page_token)
+        self.track_index.add_results(page['items'])
+        return page
+
+    def search_local(self, query):
+        return self.track_index.search(query)
+
+    def resolve(self, video_id, refresh=False):
+        entry = resolve(video_id, self.stream_cache, refresh=refresh, library=self.library)
+        self.track_index.update_track(video_id, entry['title'], entry['duration'])
+        return entry
+
+    def resolve_many(self, video_ids, background=False):
+        resolved, errors = resolve_many(video_ids, self.stream_cache, library=self.library, background=background)
+        for video_id, entry in resolved.items():
+            self.track_index.update_track(video_id, entry['title'], entry['duration'])
+        return {'resolved': resolved, 'errors': errors}
+
+    def playable_url(self, video_id, url):
+        # Remote streams are read through the local range cache; downloaded files play directly
+        if self.audio_proxy is None or not url.startswith(('http://', 'https://')):
+            return url
+        return self.audio_proxy.url_for(video_id, url)
+
+    def replay_gain(self, video_id):
+        return self.loudness.gain(video_id)
+
+    def analyze_loudness(self, video_id, source):
+        # Runs once per track; the gain applies from its next play on
+        return self.loudness.schedule(video_id, source)
+
+    def import_collection(self, url, enqueue=True, resolve_ahead=True):
+        # The window enqueues and prefetches the tracks itself, on its own thread and pool
+        title, tracks = playlists.import_collection(self.api_key, url, budget=self.quota)
+        self.track_index.add_results(tracks)
+        if enqueue:
+            with self.lock:
+                for track in tracks:
+                    self.queue.enqueue(track['video_id'], track['title'])
+        if resolve_ahead:
+            self.submit(self.resolve_ahead, self.resolve_many, [track['video_id'] for track in tracks[:IMPORT_RESOLVE_AHEAD]], True)
+        return {'title': title, 'tracks': tracks}
+
+    def warm_extractors(self):
+        streams.extractor_pool().warm()
+
+    def enqueue(self, video_id, title=None):
+        with self.lock:
+            return self.queue.enqueue(video_id, title or video_id)
+
+    def queue_state(self):
+        with self.lock:
+            return {
+                'tracks': [{'video_id': video_id, 'title': title} for video_id, title in self.queue.tracks],
+                'index': self.queue.index,
+                'detached': self.queue.detached,
+                'shuffle': self.queue.shuffle,
+                'repeat': self.queue.repeat,
+            }
+
+    def restore_queue(self, state):
+        with self.lock:
+            # The snapshot may be damaged or from an older version; anything unexpected falls back to the defaults
+            tracks = state.get('tracks')
+            if not isinstance(tracks, list):
+                tracks = []
+            self.queue.tracks = [
+                (track['video_id'], track.get('title') or track['video_id'])
+                for track in tracks if isinstance(track, dict) and isinstance(track.get('video_id'), str)
+            ]
+            index = state.get('index')
+            self.queue.index = index if isinstance(index, int) and -1 <= index < len(self.queue.tracks) else -1
+            self.queue.detached = state.get('detached') is True
+            self.queue.shuffle = state.get('shuffle') is True
+            self.queue.repeat = state.get('repeat') if state.get('repeat') in REPEAT_MODES else REPEAT_OFF
+
+    def save_settings(self, **updates):
+        self.config.update(updates)
+        if self.config_file:
+            settings.save_config(updates)
+
+    def ensure_player(self):
+        if self.player is None:
+            # Imported on first playback so search-only use never loads libvlc
+            import vlc
+            self.instance = vlc.Instance('--no-video')
+            self.player = self.instance.media_player_new()
+            events = self.player.event_manager()
+            events.event_attach(vlc.EventType.MediaPlayerEndReached, lambda event: self.events.submit(self.next))
+            events.event_attach(vlc.EventType.MediaPlayerEncounteredError, lambda event: self.events.submit(self.stream_failed))
+            events.event_attach(vlc.EventType.MediaPlayerPlaying, lambda event: self.playback_timer.started())
+            events.event_attach(vlc.EventType.MediaPlayerBuffering, lambda event: self.playback_timer.buffering(event.u.new_cache))
+        return self.player
+
+    def play(self, video_id=None, title=None):
+        with self.lock:
+            if video_id:
+                self.queue.play_now(video_id, title or video_id)
+            track = self.queue.current() or self.queue.advance()
+            if track is None:
+                return None
+            return self.play_track(track)
+
+    # Shared by the headless player below and the window's two players
+
+    def track_started(self, video_id, title):
+        # A new play, not a retry, so a failing stream may be retried again
+        self.stream_retried = False
+        self.track_index.record_play(video_id, title)
+
+    def retry_stream(self, video_id):
+        # A failed stream is retried once with a freshly resolved URL
+        if self.stream_retried:
+            return False
+        self.stream_retried = True
+        metrics.increment('stream_errors')
+        self.stream_cache.invalidate(video_id)
+        return True
+
+    def load_media(self, instance, player, video_id, url, *options):
+        url = self.playable_url(video_id, url)
+        media = instance.media_new(url)
+        for option in options:
+            media.add_option(option)
+        player.set_media(media)
+        loudness.apply_gain(player, self.replay_gain(video_id))
+        self.analyze_loudness(video_id, url)
+
+    def advance(self):
+        with self.lock:
+            return self.queue.advance()
+
+    def play_track(self, track, refresh=False):
+        video_id, title = track
+        self.playback_timer.play_requested()
+        entry = self.resolve(video_id, refresh)
+        if not refresh:
+            self.track_started(video_id, entry['title'])
+        player = self.ensure_player()
+        self.load_media(self.instance, player, video_id, entry['url'])
+        player.audio_set_volume(self.volume)
+        player.play()
+        return entry
+
+    def stream_failed(self):
+        with self.lock:
+            track = self.queue.current()
+            if track is not None and self.retry_stream(track[0]):
+                self.play_track(track, refresh=True)
+
+    def next(self):
+        with self.lock:
+            track = self.advance()
+            if track is None:
+                self.stop()
+                return None
+            return self.play_track(track)
+
+    def pause(self):
+        if self.player is not None:
+            self.player.set_pause(1)
+
+    def resume(self):
+        if self.player is not None:
+            self.player.set_pause(0)
+
+    def stop(self):
+        if self.player is not None:
+            self.player.stop()
+
+    def set_volume(self, volume):
+        self.volume = max(0, min(100, int(volume)))
+        if self.player is not None:
+            self.player.audio_set_volume(self.volume)
+        return self.volume
+
+    def seek(self, seconds):
+        if self.player is not None:
+            self.playback_timer.seeked()
+            self.player.set_time(int(float(seconds) * 1000))
+
+    def status(self):
+        with self.lock:
+            track = self.queue.current()
+        status = {
+            'video_id': track[0] if track else None,
+            'title': track[1] if track else None,
+            'state': 'idle',
+            'time': 0,
+            'length': 0,
+            'volume': self.volume,
+        }
+        if self.player is not None:
+            status['state'] = str(self.player.get_state()).split('.')[-1].lower()
+            status['time'] = max(self.player.get_time(), 0) / 1000
+            status['length'] = max(self.player.get_length(), 0) / 1000
+        return status
+
+    def quota_status(self):
+        return self.quota.status()
+
+    def metrics(self, format='json'):
+        if format == 'prometheus':
+            return metrics.to_prometheus()
+        return metrics.snapshot()
+
+    def close(self):
+        self.stop()
+        self.events.shutdown(wait=False)
+        self.details.shutdown(wait=False, cancel_futures=True)
+        self.resolve_ahead.shutdown(wait=False, cancel_futures=True)
+        self.loudness.shutdown()
+        if self.audio_proxy is not None:
+            self.audio_proxy.close()
+        self.search_cache.flush()
+        streams.close_extractors()
+        net.close()
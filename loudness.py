@@ -0,0 +1,86 @@
+import re
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Integrated loudness every track is brought to, in LUFS
+TARGET_LUFS = -14.0
+# Gain is clamped so a near-silent intro or a broken analysis can't blow out the speakers
+MAX_GAIN_DB = 12.0
+ANALYSIS_WORKERS = 2
+ANALYSIS_TIMEOUT = 600
+INTEGRATED_PATTERN = re.compile(r'I:\s+(-?\d+(?:\.\d+)?) LUFS')
+
+
+def analyze(source):
+    # ffmpeg decodes the whole track through its EBU R128 meter; the summary's integrated value is the last one printed
+    command = ['ffmpeg', '-hide_banner', '-nostats', '-i', source, '-map', '0:a:0', '-af', 'ebur128', '-f', 'null', '-']
+    result = subprocess.run(command, capture_output=True, text=True, timeout=ANALYSIS_TIMEOUT)
+    values = INTEGRATED_PATTERN.findall(result.stderr)
+    if result.returncode != 0 or not values:
+        raise RuntimeError(f'ffmpeg exited with {result.returncode}')
+    return float(values[-1])
+
+
+def gain_for(loudness, target=TARGET_LUFS):
+    return max(-MAX_GAIN_DB, min(MAX_GAIN_DB, target - loudness))
+
+
+def apply_gain(player, gain):
+    import vlc
+    if gain is None:
+        player.set_equalizer(None)
+        return
+    # A flat equalizer whose preamp carries the replay gain
+    equalizer = vlc.AudioEqualizer()
+    equalizer.set_preamp(gain)
+    player.set_equalizer(equalizer)
+
+
+class LoudnessAnalyzer:
+    def __init__(self, track_index, target=TARGET_LUFS, enabled=True, max_workers=ANALYSIS_WORKERS):
+        self.track_index = track_index
+        self.target = target
+        self.enabled = enabled and shutil.which('ffmpeg') is not None
+        self.max_workers = max_workers
+        self.executor = None
+        self.lock = threading.Lock()
+        self.pending = set()
+
+    def gain(self, video_id):
+        if not self.enabled:
+            return None
+        loudness = self.track_index.loudness(video_id)
+        return None if loudness is None else gain_for(loudness, self.target)
+
+    def schedule(self, video_id, source):
+        if not self.enabled:
+            return False
+        with self.lock:
+            if video_id in self.pending or self.track_index.loudness(video_id) is not None:
+                return False
+            if self.executor is None:
+                # ffmpeg does the decoding in its own process, so threads only wait on it
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='loudness')
+            self.pending.add(video_id)
+            future = self.executor.submit(analyze, source)
+        future.add_done_callback(lambda future: self.analyzed(video_id, future))
+        return True
+
+    def analyzed(self, video_id, future):
+        with self.lock:
+            self.pending.discard(video_id)
+        if future.cancelled():
+            return
+        try:
+            loudness = future.result()
+        except Exception as e:
+            print(f"Loudness analysis failed for {video_id}: {e}")
+            return
+        self.track_index.set_loudness(video_id, loudness)
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,154 @@
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import net
+
+PROMETHEUS_PREFIX = 'youtufy'
+
+
+def metric_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Phase timings have the same shape as the per-host HTTP latencies
+        self.phases = net.LatencyStats()
+        self.counters = {}
+
+    def observe(self, phase, seconds, error=False):
+        self.phases.record(phase, seconds, error)
+
+    @contextmanager
+    def timer(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.observe(phase, time.perf_counter() - start, error=True)
+            raise
+        self.observe(phase, time.perf_counter() - start)
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def cache_lookup(self, cache, hit):
+        self.increment(f'{cache}_cache_hits' if hit else f'{cache}_cache_misses')
+
+    def hit_rates(self, counters):
+        rates = {}
+        for name in counters:
+            cache, _, outcome = name.rpartition('_cache_')
+            if cache and outcome in ('hits', 'misses') and cache not in rates:
+                hits = counters.get(f'{cache}_cache_hits', 0)
+                rates[cache] = hits / (hits + counters.get(f'{cache}_cache_misses', 0))
+        return rates
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+        return {
+            'phases': self.phases.snapshot(),
+            'counters': counters,
+            'cache_hit_rates': self.hit_rates(counters),
+            'http': net.latency.snapshot(),
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+        for family, label, stats in (('phase_seconds', 'phase', snapshot['phases']), ('http_request_seconds', 'host', snapshot['http'])):
+            name = f'{PROMETHEUS_PREFIX}_{family}'
+            lines.append(f'# TYPE {name} summary')
+            for key, values in sorted(stats.items()):
+                labels = f'{label}="{escape_label(key)}"'
+                lines.append(f'{name}_count{{{labels}}} {values["count"]}')
+                lines.append(f'{name}_sum{{{labels}}} {values["total"]:.6f}')
+            lines.append(f'# TYPE {name}_max gauge')
+            for key, values in sorted(stats.items()):
+                lines.append(f'{name}_max{{{label}="{escape_label(key)}"}} {values["max"]:.6f}')
+            lines.append(f'# TYPE {name[:-len("_seconds")]}_errors_total counter')
+            for key, values in sorted(stats.items()):
+                lines.append(f'{name[:-len("_seconds")]}_errors_total{{{label}="{escape_label(key)}"}} {values["errors"]}')
+        for counter, value in sorted(snapshot['counters'].items()):
+            name = f'{PROMETHEUS_PREFIX}_{metric_name(counter)}_total'
+            lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {value}')
+        name = f'{PROMETHEUS_PREFIX}_cache_hit_ratio'
+        lines.append(f'# TYPE {name} gauge')
+        for cache, rate in sorted(snapshot['cache_hit_rates'].items()):
+            lines.append(f'{name}{{cache="{escape_label(cache)}"}} {rate:.4f}')
+        return '\n'.join(lines) + '\n'
+
+    def report(self):
+        snapshot = self.snapshot()
+        lines = ['Timings (count, mean, max, errors):']
+        for phase, stats in sorted(snapshot['phases'].items()):
+            lines.append(f'  {phase:<24} {stats["count"]:6}  {stats["mean"] * 1000:8.1f} ms  {stats["max"] * 1000:8.1f} ms  {stats["errors"]:4}')
+        lines.append('HTTP latency by host:')
+        for host, stats in sorted(snapshot['http'].items()):
+            lines.append(f'  {host:<24} {stats["count"]:6}  {stats["mean"] * 1000:8.1f} ms  {stats["max"] * 1000:8.1f} ms  {stats["errors"]:4}')
+        lines.append('Cache hit rates:')
+        for cache, rate in sorted(snapshot['cache_hit_rates'].items()):
+            lines.append(f'  {cache:<24} {rate * 100:5.1f} %')
+        lines.append('Counters:')
+        for counter, value in sorted(snapshot['counters'].items()):
+            lines.append(f'  {counter:<24} {value:8}')
+        return '\n'.join(lines)
+
+
+metrics = Metrics()
+
+
+class PlaybackTimer:
+    # Follows one player's events to time the wait for first audio and any stalls once playing
+    def __init__(self):
+        self.requested = None
+        self.playing = False
+        self.seeking = False
+        self.stall_started = None
+
+    def play_requested(self):
+        self.requested = time.perf_counter()
+        self.playing = False
+        self.seeking = False
+        self.stall_started = None
+
+    def seeked(self):
+        # Refilling the buffer after a seek is expected, not a stall
+        self.seeking = True
+
+    def started(self):
+        now = time.perf_counter()
+        if self.requested is not None:
+            metrics.observe('time_to_first_audio', now - self.requested)
+            self.requested = None
+        self.end_stall(now)
+        self.playing = True
+
+    def buffering(self, percent):
+        if not self.playing:
+            return
+        if percent >= 100:
+            self.seeking = False
+            self.end_stall(time.perf_counter())
+        elif not self.seeking and self.stall_started is None:
+            self.stall_started = time.perf_counter()
+            metrics.increment('buffer_stalls')
+
+    def end_stall(self, now):
+        if self.stall_started is not None:
+            metrics.observe('buffer_stall', now - self.stall_started)
+            self.stall_started = None
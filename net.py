@@ -0,0 +1,99 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 20
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+# Connections kept alive per host; one pool per host
+POOL_SIZE = 10
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class LatencyStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def record(self, host, seconds, error=False):
+        with self.lock:
+            stats = self.hosts.setdefault(host, {'count': 0, 'errors': 0, 'total': 0.0, 'min': None, 'max': 0.0, 'last': 0.0})
+            stats['count'] += 1
+            stats['errors'] += int(error)
+            stats['total'] += seconds
+            stats['min'] = seconds if stats['min'] is None else min(stats['min'], seconds)
+            stats['max'] = max(stats['max'], seconds)
+            stats['last'] = seconds
+
+    def snapshot(self):
+        with self.lock:
+            return {host: dict(stats, mean=stats['total'] / stats['count']) for host, stats in self.hosts.items()}
+
+
+latency = LatencyStats()
+
+
+def configure(connect_timeout=None, read_timeout=None, retries=None):
+    global CONNECT_TIMEOUT, READ_TIMEOUT, RETRIES, _session
+    if connect_timeout is not None:
+        CONNECT_TIMEOUT = connect_timeout
+    if read_timeout is not None:
+        READ_TIMEOUT = read_timeout
+    if retries is not None:
+        RETRIES = retries
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def create_session():
+    # requests is imported here so the window can appear before the HTTP stack is loaded
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    retry = Retry(
+        total=RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # Google APIs only serve gzip to clients whose User-Agent mentions it
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    session.headers['User-Agent'] = 'YouTufy (gzip)'
+    return session
+
+
+def session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def get(url, **kwargs):
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+    host = urlparse(url).netloc
+    http = session()
+    start = time.perf_counter()
+    try:
+        response = http.get(url, **kwargs)
+    except Exception:
+        latency.record(host, time.perf_counter() - start, error=True)
+        raise
+    latency.record(host, time.perf_counter() - start, error=response.status_code >= 400)
+    return response
+
+
+def close():
+    configure()
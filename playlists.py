@@ -0,0 +1,49 @@
+import re
+
+import youtube
+
+COLLECTION_PATTERN = re.compile(r'(?:youtube\.com|youtu\.be)/(?:playlist\?|watch\?.*\blist=|channel/|c/|user/|@)')
+CHANNEL_PATTERN = re.compile(r'youtube\.com/(?:channel/[^/?#]+|c/[^/?#]+|user/[^/?#]+|@[^/?#]+)/?$')
+VIDEO_ID_PATTERN = re.compile(r'^[\w-]{11}$')
+IMPORT_LIMIT = 1000
+
+
+def is_collection_url(text):
+    return bool(COLLECTION_PATTERN.search(text.strip()))
+
+
+def playlist_url(url):
+    url = url.strip()
+    # A bare channel URL lists its tabs; the uploads live under /videos
+    if CHANNEL_PATTERN.search(url):
+        return url.rstrip('/') + '/videos'
+    match = re.search(r'[?&]list=([\w-]+)', url)
+    if match and '/playlist' not in url:
+        return f'https://www.youtube.com/playlist?list={match.group(1)}'
+    return url
+
+
+def enumerate_entries(url, limit=IMPORT_LIMIT):
+    # Flat extraction only reads the playlist pages, never the individual videos
+    import yt_dlp
+    ydl_opts = {
+        'extract_flat': 'in_playlist',
+        'playlistend': limit,
+        'quiet': True,
+        'no_warnings': True,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info_dict = ydl.extract_info(playlist_url(url), download=False)
+    video_ids = []
+    for entry in info_dict.get('entries') or []:
+        video_id = (entry or {}).get('id')
+        if video_id and VIDEO_ID_PATTERN.match(video_id):
+            video_ids.append(video_id)
+    return info_dict.get('title') or url, video_ids
+
+
+def import_collection(api_key, url, limit=IMPORT_LIMIT, budget=None):
+    title, video_ids = enumerate_entries(url, limit)
+    details = youtube.videos(api_key, video_ids, budget)
+    # Private and deleted videos are missing from videos.list and are dropped here
+    return title, [details[video_id] for video_id in video_ids if video_id in details]
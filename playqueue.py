@@ -0,0 +1,110 @@
+import random
+
+REPEAT_OFF = 'off'
+REPEAT_ALL = 'all'
+REPEAT_ONE = 'one'
+REPEAT_MODES = [REPEAT_OFF, REPEAT_ALL, REPEAT_ONE]
+
+
+class PlayQueue:
+    def __init__(self):
+        self.tracks = []
+        self.index = -1
+        # Set when the current track was removed: index then stays on the track before it, so the
+        # queue carries on where the removed track would have, but nothing in it is current
+        self.detached = False
+        self.shuffle = False
+        self.repeat = REPEAT_OFF
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def current(self):
+        if not self.detached and 0 <= self.index < len(self.tracks):
+            return self.tracks[self.index]
+        return None
+
+    def enqueue(self, video_id, title):
+        if self.shuffle and self.index + 1 < len(self.tracks):
+            position = random.randint(self.index + 1, len(self.tracks))
+        else:
+            position = len(self.tracks)
+        self.tracks.insert(position, (video_id, title))
+        return position
+
+    def play_next(self, video_id, title):
+        position = self.index + 1
+        self.tracks.insert(position, (video_id, title))
+        return position
+
+    def play_now(self, video_id, title):
+        self.index = self.play_next(video_id, title)
+        self.detached = False
+        return self.current()
+
+    def jump(self, position):
+        if 0 <= position < len(self.tracks):
+            self.index = position
+            self.detached = False
+        return self.current()
+
+    def remove(self, position):
+        if not 0 <= position < len(self.tracks):
+            return
+        del self.tracks[position]
+        if position == self.index and not self.detached:
+            self.detached = True
+        if position <= self.index:
+            self.index -= 1
+
+    def move(self, source, destination):
+        if not 0 <= source < len(self.tracks):
+            return
+        destination = max(0, min(destination, len(self.tracks) - 1))
+        track = self.tracks.pop(source)
+        self.tracks.insert(destination, track)
+        if self.index == source:
+            self.index = destination
+        elif source < self.index <= destination:
+            self.index -= 1
+        elif destination <= self.index < source:
+            self.index += 1
+
+    def set_shuffle(self, enabled):
+        self.shuffle = enabled
+        if enabled:
+            upcoming = self.tracks[self.index + 1:]
+            random.shuffle(upcoming)
+            self.tracks[self.index + 1:] = upcoming
+
+    def cycle_repeat(self):
+        self.repeat = REPEAT_MODES[(REPEAT_MODES.index(self.repeat) + 1) % len(REPEAT_MODES)]
+        return self.repeat
+
+    def next_index(self):
+        if not self.tracks:
+            return None
+        if self.repeat == REPEAT_ONE and self.current() is not None:
+            return self.index
+        if self.index + 1 < len(self.tracks):
+            return self.index + 1
+        if self.repeat == REPEAT_ALL:
+            return 0
+        return None
+
+    def peek_next(self):
+        position = self.next_index()
+        return None if position is None else self.tracks[position]
+
+    def advance(self):
+        position = self.next_index()
+        if position is None:
+            return None
+        self.index = position
+        self.detached = False
+        return self.current()
+
+    def clear(self):
+        self.tracks = []
+        self.index = -1
+        self.detached = False
@@ -0,0 +1,55 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from streams import resolve
+from thumbnails import load_thumbnail
+
+PREFETCH_WORKERS = 3
+
+
+class Prefetcher:
+    def __init__(self, stream_cache, thumbnail_cache, library=None, max_workers=PREFETCH_WORKERS):
+        self.stream_cache = stream_cache
+        self.library = library
+        self.thumbnail_cache = thumbnail_cache
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.futures = []
+        self.scheduled = set()
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+            for future in self.futures:
+                future.cancel()
+            self.futures = []
+            self.scheduled = set()
+
+    def schedule(self, video_id, thumbnail_url=None):
+        with self.lock:
+            if video_id in self.scheduled:
+                return
+            self.scheduled.add(video_id)
+            self.futures = [future for future in self.futures if not future.done()]
+            self.futures.append(self.executor.submit(self.prefetch, self.generation, video_id, thumbnail_url))
+
+    def is_current(self, generation):
+        with self.lock:
+            return generation == self.generation
+
+    def prefetch(self, generation, video_id, thumbnail_url):
+        if not self.is_current(generation):
+            return
+        if video_id not in self.thumbnail_cache:
+            load_thumbnail(video_id, thumbnail_url, self.thumbnail_cache)
+        if not self.is_current(generation):
+            return
+        try:
+            resolve(video_id, self.stream_cache, library=self.library, background=True)
+        except Exception as e:
+            print(f"Prefetch error: {e}")
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
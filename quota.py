@@ -0,0 +1,86 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from metrics import metrics
+from storage import read_json, write_json
+
+QUOTA_FILE = os.path.join('cache', 'quota.json')
+# The Data API's default allowance; set DAILY_QUOTA lower when several installs share one key
+DAILY_QUOTA = 10000
+# Share of the day's quota that may be spent up front; the rest unlocks evenly over the day
+BURST_FRACTION = 0.2
+# Below this share of the day's quota, stale cached searches are served without revalidating
+LOW_FRACTION = 0.1
+
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+except Exception:
+    QUOTA_TIMEZONE = timezone(timedelta(hours=-8))
+
+
+class QuotaExhausted(Exception):
+    pass
+
+
+class QuotaBudget:
+    # Local ledger of Data API units spent today; Google resets quotas at midnight Pacific time
+    def __init__(self, path=QUOTA_FILE, daily_limit=DAILY_QUOTA, burst_fraction=BURST_FRACTION):
+        self.path = path
+        self.daily_limit = daily_limit
+        self.burst_fraction = burst_fraction
+        self.lock = threading.Lock()
+        ledger = read_json(path, {})
+        self.day = ledger.get('day')
+        self.spent = ledger.get('spent', 0)
+
+    def now(self):
+        return datetime.now(QUOTA_TIMEZONE)
+
+    def roll_over(self, now):
+        day = now.date().isoformat()
+        if day != self.day:
+            self.day = day
+            self.spent = 0
+
+    def available(self):
+        with self.lock:
+            return self.available_locked(self.now())
+
+    def available_locked(self, now):
+        self.roll_over(now)
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        day_fraction = (now - midnight).total_seconds() / 86400
+        # Paced so a shared key is not used up by a morning of heavy searching
+        paced = self.daily_limit * min(1.0, self.burst_fraction + day_fraction)
+        return max(0, int(min(self.daily_limit, paced) - self.spent))
+
+    def low(self):
+        return self.available() < self.daily_limit * LOW_FRACTION
+
+    def spend(self, units):
+        with self.lock:
+            if self.available_locked(self.now()) < units:
+                metrics.increment('youtube_quota_rejections')
+                raise QuotaExhausted(f'YouTube API quota budget reached ({self.spent} of {self.daily_limit} units spent today)')
+            self.spent += units
+            write_json(self.path, {'day': self.day, 'spent': self.spent})
+
+    def refund(self, units):
+        with self.lock:
+            self.roll_over(self.now())
+            self.spent = max(0, self.spent - units)
+            write_json(self.path, {'day': self.day, 'spent': self.spent})
+
+    def exhaust(self):
+        # The API itself reported the quota as used up, whatever the local ledger says
+        with self.lock:
+            self.roll_over(self.now())
+            self.spent = max(self.spent, self.daily_limit)
+            write_json(self.path, {'day': self.day, 'spent': self.spent})
+
+    def status(self):
+        with self.lock:
+            available = self.available_locked(self.now())
+            return {'day': self.day, 'spent': self.spent, 'limit': self.daily_limit, 'available': available}
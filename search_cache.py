@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import metrics
+from storage import read_json, write_file
+
+SEARCH_CACHE_FILE = os.path.join('cache', 'searches.json')
+# Results older than this are still shown, but revalidated in the background
+SEARCH_TTL = 6 * 60 * 60
+SEARCH_CACHE_SIZE = 200
+CACHE_VERSION = 3
+# Pages fetched within this window are written together
+SAVE_DELAY = 2.0
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+class SearchCache:
+    def __init__(self, path=SEARCH_CACHE_FILE, ttl=SEARCH_TTL, max_entries=SEARCH_CACHE_SIZE, save_delay=SAVE_DELAY):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.save_delay = save_delay
+        self.lock = threading.Lock()
+        # Writers take this one, so get() on the GUI thread never waits for the file
+        self.save_lock = threading.Lock()
+        self.timer = None
+        self.dirty = False
+        self.inflight = {}
+        self.entries = self.load()
+        # Entries kept encoded, so a save only encodes pages fetched since the last one
+        self.encoded = {}
+
+    def key(self, query, filter_enabled, page_token=None):
+        return f'{int(bool(filter_enabled))}:{page_token or ""}:{normalize_query(query)}'
+
+    def load(self):
+        data = read_json(self.path, None)
+        if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+            return OrderedDict()
+        return OrderedDict(sorted(data['entries'].items(), key=lambda item: item[1]['fetched']))
+
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                self.timer = None
+                if not self.dirty:
+                    return
+                self.dirty = False
+                entries = list(self.entries.items())
+            parts = []
+            for key, entry in entries:
+                encoded = self.encoded.get(key)
+                if encoded is None or encoded[0] is not entry:
+                    encoded = self.encoded[key] = (entry, json.dumps(entry))
+                parts.append(f'{json.dumps(key)}: {encoded[1]}')
+            for key in self.encoded.keys() - {key for key, entry in entries}:
+                del self.encoded[key]
+            write_file(self.path, f'{{"version": {CACHE_VERSION}, "entries": {{{", ".join(parts)}}}}}')
+
+    def flush(self):
+        with self.lock:
+            timer, self.timer = self.timer, None
+        if timer is not None:
+            timer.cancel()
+        self.save()
+
+    def get(self, query, filter_enabled, page_token=None):
+        key = self.key(query, filter_enabled, page_token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                metrics.cache_lookup('search', False)
+                return None, False
+            self.entries.move_to_end(key)
+            fresh = time.time() - entry['fetched'] < self.ttl
+        metrics.cache_lookup('search', fresh)
+        return entry['results'], fresh
+
+    def put(self, query, filter_enabled, results, page_token=None):
+        key = self.key(query, filter_enabled, page_token)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = {'results': results, 'fetched': time.time()}
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+            if self.timer is None:
+                self.timer = threading.Timer(self.save_delay, self.save)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def fetch(self, query, filter_enabled, loader, page_token=None):
+        # Identical searches already in flight wait for the first one instead of hitting the API again
+        key = self.key(query, filter_enabled, page_token)
+        with self.lock:
+            event = self.inflight.get(key)
+            owner = event is None
+            if owner:
+                event = self.inflight[key] = threading.Event()
+        if not owner:
+            event.wait()
+            results, fresh = self.get(query, filter_enabled, page_token)
+            if results is not None:
+                return results
+            return self.fetch(query, filter_enabled, loader, page_token)
+        try:
+            results = loader()
+            self.put(query, filter_enabled, results, page_token)
+            return results
+        finally:
+            with self.lock:
+                del self.inflight[key]
+            event.set()
@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+
+from storage import read_json, write_file
+
+SESSION_FILE = os.path.join('cache', 'session.json')
+SESSION_VERSION = 1
+# Changes within this window are written together
+SAVE_DELAY = 2.0
+
+
+class SessionStore:
+    # Snapshot of what the window showed last time, split into sections that are saved as they change.
+    # Each section is kept encoded, so a save only re-encodes the sections that changed since the last one.
+    def __init__(self, path=SESSION_FILE, save_delay=SAVE_DELAY):
+        self.path = path
+        self.save_delay = save_delay
+        self.lock = threading.Lock()
+        self.encoded = {}
+        self.decoded = {}
+        self.timer = None
+        self.load()
+
+    def load(self):
+        data = read_json(self.path, None)
+        if not isinstance(data, dict) or data.get('version') != SESSION_VERSION:
+            return
+        for section, value in data.get('sections', {}).items():
+            self.decoded[section] = value
+            self.encoded[section] = json.dumps(value, separators=(',', ':'))
+
+    def get(self, section, default=None):
+        with self.lock:
+            return self.decoded.get(section, default)
+
+    def update(self, section, value):
+        encoded = json.dumps(value, separators=(',', ':'))
+        with self.lock:
+            if self.encoded.get(section) == encoded:
+                return
+            self.encoded[section] = encoded
+            self.decoded[section] = value
+            if self.timer is None:
+                self.timer = threading.Timer(self.save_delay, self.save)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def save(self):
+        with self.lock:
+            self.timer = None
+            sections = ','.join(f'{json.dumps(section)}:{encoded}' for section, encoded in self.encoded.items())
+            write_file(self.path, f'{{"version":{SESSION_VERSION},"sections":{{{sections}}}}}')
+
+    def flush(self):
+        with self.lock:
+            timer, self.timer = self.timer, None
+        if timer is not None:
+            timer.cancel()
+        self.save()
+
+
+# The snapshot may be damaged or from an older version; sections are checked before use and dropped when malformed
+
+def restored_result(item):
+    if not isinstance(item, dict) or not isinstance(item.get('video_id'), str) or not isinstance(item.get('title'), str):
+        return None
+    result = dict(item)
+    if not isinstance(result.get('channel'), str):
+        result['channel'] = ''
+    if not isinstance(result.get('thumbnail_url'), str):
+        result['thumbnail_url'] = None
+    if result.get('local') and not isinstance(result.get('play_count'), int):
+        result['local'] = False
+    return result
+
+
+def restored_search(section):
+    if not isinstance(section, dict) or not isinstance(section.get('query'), str) or not isinstance(section.get('page'), dict):
+        return None
+    items = section['page'].get('items')
+    results = [result for result in map(restored_result, items if isinstance(items, list) else []) if result is not None]
+    next_page_token = section['page'].get('next_page_token')
+    return {
+        'query': section['query'],
+        'filter': section.get('filter') is not False,
+        'page': {'items': results, 'next_page_token': next_page_token if isinstance(next_page_token, str) else None},
+    }
+
+
+def restored_playback(section):
+    if not isinstance(section, dict) or not isinstance(section.get('video_id'), str):
+        return None
+    position = section.get('position')
+    title = section.get('title')
+    return {
+        'video_id': section['video_id'],
+        'title': title if isinstance(title, str) else section['video_id'],
+        'position': position if isinstance(position, int) and not isinstance(position, bool) and position >= 0 else 0,
+    }
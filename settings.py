@@ -0,0 +1,21 @@
+import json
+
+from storage import write_json
+
+CONFIG_FILE = 'config.json'
+
+_config = None
+
+
+def load_config(path=CONFIG_FILE):
+    global _config
+    if _config is None:
+        with open(path) as config_file:
+            _config = json.load(config_file)
+    return _config
+
+
+def save_config(updates, path=CONFIG_FILE):
+    config = load_config(path)
+    config.update(updates)
+    write_json(path, config, indent=4)
@@ -0,0 +1,24 @@
+import os
+import sys
+import time
+
+# Imported first by the entry points, so this is as close to process start as Python gets
+START = time.perf_counter()
+marks = []
+
+
+def mark(name):
+    marks.append((name, time.perf_counter()))
+
+
+def enabled():
+    return bool(os.environ.get('YOUTUFY_STARTUP_REPORT')) or '--startup-report' in sys.argv
+
+
+def report():
+    lines = ['Startup report:']
+    previous = START
+    for name, timestamp in sorted(marks, key=lambda item: item[1]):
+        lines.append(f'  {name:<24} +{(timestamp - previous) * 1000:8.1f} ms  (at {(timestamp - START) * 1000:8.1f} ms)')
+        previous = timestamp
+    return '\n'.join(lines)
@@ -0,0 +1,23 @@
+import json
+import os
+
+
+def write_file(path, data):
+    # Written beside the target and renamed over it, so readers never see a partial file
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb' if isinstance(data, bytes) else 'w') as output_file:
+        output_file.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_json(path, data, **options):
+    write_file(path, json.dumps(data, **options))
+
+
+def read_json(path, default):
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return default
@@ -0,0 +1,318 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+
+from metrics import metrics
+from storage import read_json, write_json
+
+CACHE_DIR = 'cache'
+STREAM_CACHE_FILE = os.path.join(CACHE_DIR, 'streams.json')
+DEFAULT_FORMAT = 'bestaudio'
+# googlevideo URLs normally live ~6h; used when the URL carries no expire param
+DEFAULT_TTL = 6 * 60 * 60
+# Treat entries as expired a little early so playback never starts on a dying URL
+EXPIRY_MARGIN = 5 * 60
+EXTRACTOR_POOL_SIZE = 2
+# yt-dlp persists player JS signature and n-parameter functions here between runs
+EXTRACTOR_CACHE_DIR = os.path.join(CACHE_DIR, 'yt-dlp')
+
+
+def url_expiry(url):
+    query = parse_qs(urlparse(url).query)
+    if 'expire' in query:
+        try:
+            return int(query['expire'][0])
+        except ValueError:
+            pass
+    match = re.search(r'/expire/(\d+)', url)
+    if match:
+        return int(match.group(1))
+    return int(time.time()) + DEFAULT_TTL
+
+
+class StreamCache:
+    def __init__(self, path=STREAM_CACHE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        # Read on first lookup rather than at startup
+        self.entries = None
+
+    def key(self, video_id, fmt):
+        return f'{video_id}:{fmt}'
+
+    def load(self):
+        entries = read_json(self.path, {})
+        now = time.time()
+        return {key: entry for key, entry in entries.items() if entry.get('expires', 0) - EXPIRY_MARGIN > now}
+
+    def save(self):
+        write_json(self.path, self.loaded())
+
+    def loaded(self):
+        if self.entries is None:
+            self.entries = self.load()
+        return self.entries
+
+    def get(self, video_id, fmt=DEFAULT_FORMAT):
+        with self.lock:
+            entry = self.loaded().get(self.key(video_id, fmt))
+            if entry is not None and entry['expires'] - EXPIRY_MARGIN <= time.time():
+                del self.entries[self.key(video_id, fmt)]
+                entry = None
+        metrics.cache_lookup('stream', entry is not None)
+        return entry
+
+    def put(self, video_id, fmt, url, title, duration):
+        entry = {
+            'url': url,
+            'title': title,
+            'duration': duration,
+            'expires': url_expiry(url),
+        }
+        with self.lock:
+            self.loaded()[self.key(video_id, fmt)] = entry
+            self.save()
+        return entry
+
+    def invalidate(self, video_id, fmt=DEFAULT_FORMAT):
+        with self.lock:
+            if self.loaded().pop(self.key(video_id, fmt), None) is not None:
+                self.save()
+
+
+def extractor_options(fmt):
+    return {
+        'format': fmt,
+        'noplaylist': True,
+        'quiet': True,
+        'no_warnings': True,
+        'cachedir': EXTRACTOR_CACHE_DIR,
+    }
+
+
+def video_url(video_id):
+    return f'https://www.youtube.com/watch?v={video_id}'
+
+
+class ExtractorPool:
+    # Long-lived YoutubeDL instances; each keeps its extractors and their in-memory player JS cache warm.
+    # Background extractions (prefetch, imports) only get an instance when no foreground one is waiting.
+    def __init__(self, fmt=DEFAULT_FORMAT, size=EXTRACTOR_POOL_SIZE, factory=None):
+        self.fmt = fmt
+        self.size = size
+        self.factory = factory
+        self.idle = []
+        self.lock = threading.Lock()
+        self.released = threading.Condition(self.lock)
+        self.waiting = 0
+        self.created = 0
+        self.instances = []
+
+    def reserve(self):
+        with self.lock:
+            return self.reserve_locked()
+
+    def reserve_locked(self):
+        if self.created >= self.size:
+            return False
+        self.created += 1
+        return True
+
+    def create(self):
+        factory = self.factory
+        if factory is None:
+            # yt-dlp loads hundreds of extractor modules, so it is only imported once something needs resolving
+            import yt_dlp
+            factory = yt_dlp.YoutubeDL
+        try:
+            ydl = factory(extractor_options(self.fmt))
+        except Exception:
+            with self.lock:
+                self.created -= 1
+                self.released.notify_all()
+            raise
+        with self.lock:
+            self.instances.append(ydl)
+        return ydl
+
+    def acquire(self, urgent=None):
+        # urgent is None for foreground requests; background ones pass an Event that is set if something
+        # in the foreground starts waiting on them
+        counted = False
+        with self.lock:
+            try:
+                while True:
+                    if not counted and (urgent is None or urgent.is_set()):
+                        counted = True
+                        self.waiting += 1
+                    if counted or not self.waiting:
+                        if self.idle:
+                            return self.idle.pop()
+                        if self.reserve_locked():
+                            break
+                    self.released.wait()
+            finally:
+                if counted:
+                    self.waiting -= 1
+                    # Background waiters may have been passed over for this one
+                    self.released.notify_all()
+        return self.create()
+
+    def release(self, ydl):
+        with self.lock:
+            self.idle.append(ydl)
+            self.released.notify_all()
+
+    def wake(self):
+        with self.lock:
+            self.released.notify_all()
+
+    def warm(self):
+        while self.reserve():
+            self.release(self.create())
+
+    def extract(self, video_id, urgent=None):
+        ydl = self.acquire(urgent)
+        try:
+            info_dict = ydl.extract_info(video_url(video_id), download=False)
+        finally:
+            self.release(ydl)
+        return {'url': info_dict['url'], 'title': info_dict['title'], 'duration': info_dict.get('duration')}
+
+    def close(self):
+        with self.lock:
+            instances, self.instances = self.instances, []
+        for ydl in instances:
+            ydl.close()
+
+
+_worker_ydl = None
+
+
+def _init_worker(fmt):
+    global _worker_ydl
+    import yt_dlp
+    _worker_ydl = yt_dlp.YoutubeDL(extractor_options(fmt))
+
+
+def _extract_in_worker(video_id):
+    info_dict = _worker_ydl.extract_info(video_url(video_id), download=False)
+    return {'url': info_dict['url'], 'title': info_dict['title'], 'duration': info_dict.get('duration')}
+
+
+class ProcessExtractorPool:
+    # Same interface as ExtractorPool, but signature deciphering runs outside this process's GIL
+    def __init__(self, fmt=DEFAULT_FORMAT, size=EXTRACTOR_POOL_SIZE):
+        self.size = size
+        self.executor = ProcessPoolExecutor(max_workers=size, initializer=_init_worker, initargs=(fmt,))
+
+    def wake(self):
+        pass
+
+    def warm(self):
+        for future in [self.executor.submit(int) for _ in range(self.size)]:
+            future.result()
+
+    def extract(self, video_id, urgent=None):
+        # Worker processes take jobs in order, so background extractions are not deprioritised here
+        return self.executor.submit(_extract_in_worker, video_id).result()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pool_size = EXTRACTOR_POOL_SIZE
+_use_processes = False
+_factory = None
+
+
+def configure_extractors(size=None, processes=None, factory=None):
+    # factory stands in for yt_dlp.YoutubeDL; only honoured by the in-process pool
+    global _pool_size, _use_processes, _factory
+    if size is not None:
+        _pool_size = size
+    if processes is not None:
+        _use_processes = processes
+    if factory is not None:
+        _factory = factory
+    close_extractors()
+
+
+def extractor_pool(fmt=DEFAULT_FORMAT):
+    with _pools_lock:
+        pool = _pools.get(fmt)
+        if pool is None:
+            if _use_processes and _factory is None:
+                pool = ProcessExtractorPool(fmt, _pool_size)
+            else:
+                pool = ExtractorPool(fmt, _pool_size, _factory)
+            _pools[fmt] = pool
+        return pool
+
+
+def close_extractors():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def resolve(video_id, cache, fmt=DEFAULT_FORMAT, refresh=False, library=None, background=False):
+    # Downloaded tracks play straight from disk without touching YouTube
+    track = library.get(video_id) if library is not None else None
+    if track is not None:
+        return {'url': track['path'], 'title': track['title'], 'duration': None, 'expires': None}
+    if not refresh:
+        entry = cache.get(video_id, fmt)
+        if entry is not None:
+            return entry
+    # A click on a row that is still being prefetched waits for that extraction instead of starting another
+    key = (video_id, fmt)
+    with _inflight_lock:
+        inflight = _inflight.get(key)
+        owner = inflight is None
+        if owner:
+            inflight = _inflight[key] = (threading.Event(), threading.Event() if background else None)
+    done, urgent = inflight
+    if not owner:
+        if not background and urgent is not None:
+            # The extraction was queued behind foreground work; it is foreground work now
+            urgent.set()
+            extractor_pool(fmt).wake()
+        done.wait()
+        entry = cache.get(video_id, fmt)
+        if entry is not None:
+            return entry
+        return resolve(video_id, cache, fmt, refresh, library, background)
+    try:
+        with metrics.timer('resolve'):
+            info = extractor_pool(fmt).extract(video_id, urgent)
+        return cache.put(video_id, fmt, info['url'], info['title'], info['duration'])
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        done.set()
+
+
+def resolve_many(video_ids, cache, fmt=DEFAULT_FORMAT, library=None, max_workers=None, background=False):
+    # Cached IDs return immediately; the rest are spread over the warm extractor pool
+    resolved = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max_workers or _pool_size, thread_name_prefix='resolve') as executor:
+        futures = {video_id: executor.submit(resolve, video_id, cache, fmt, False, library, background) for video_id in dict.fromkeys(video_ids)}
+        for video_id, future in futures.items():
+            try:
+                resolved[video_id] = future.result()
+            except Exception as e:
+                errors[video_id] = str(e)
+    return resolved, errors
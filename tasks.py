@@ -0,0 +1,90 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+TASK_WORKERS = 4
+
+
+class TaskScheduler(QObject):
+    # Runs blocking work on a bounded pool and hands results back on the GUI thread.
+    # Each channel only delivers its newest task: submitting again cancels the previous one if it
+    # has not started yet, and drops its result if it has.
+    completed = pyqtSignal(str, int, object, object)
+
+    def __init__(self, max_workers=TASK_WORKERS):
+        super().__init__()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='task')
+        self.lock = threading.Lock()
+        self.generations = {}
+        self.futures = {}
+        self.timers = {}
+        self.stopped = False
+        # Emitted from pool threads; the queued connection runs deliver on the GUI thread
+        self.completed.connect(self.deliver)
+
+    def submit(self, channel, work, on_done=None, on_error=None):
+        with self.lock:
+            if self.stopped:
+                # The window may still ask for work while it is being torn down
+                return None
+            generation = self.generations.get(channel, 0) + 1
+            self.generations[channel] = generation
+            previous = self.futures.pop(channel, None)
+            if previous is not None:
+                previous.cancel()
+            self.futures[channel] = self.executor.submit(self.run, channel, generation, work, on_done, on_error)
+        return generation
+
+    def current(self, channel, generation):
+        with self.lock:
+            return self.generations.get(channel) == generation
+
+    def run(self, channel, generation, work, on_done, on_error):
+        if not self.current(channel, generation):
+            return
+        try:
+            result = work()
+        except Exception as e:
+            print(f"Error: {e}")
+            self.completed.emit(channel, generation, on_error, e)
+            return
+        self.completed.emit(channel, generation, on_done, result)
+
+    def deliver(self, channel, generation, callback, value):
+        with self.lock:
+            if self.generations.get(channel) == generation:
+                self.futures.pop(channel, None)
+            else:
+                return
+        if callback is not None:
+            callback(value)
+
+    def cancel(self, channel):
+        with self.lock:
+            self.generations[channel] = self.generations.get(channel, 0) + 1
+            future = self.futures.pop(channel, None)
+        if future is not None:
+            future.cancel()
+        timer = self.timers.get(channel)
+        if timer is not None:
+            timer.stop()
+
+    def debounce(self, channel, delay_ms, callback):
+        # Restarts the channel's timer on every call, so callback only runs once input settles
+        timer = self.timers.get(channel)
+        if timer is None:
+            timer = self.timers[channel] = QTimer(self)
+            timer.setSingleShot(True)
+        else:
+            timer.timeout.disconnect()
+        timer.timeout.connect(callback)
+        timer.start(delay_ms)
+
+    def shutdown(self):
+        for timer in self.timers.values():
+            timer.stop()
+        with self.lock:
+            self.stopped = True
+            self.generations.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
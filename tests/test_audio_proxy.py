@@ -0,0 +1,45 @@
+from audio_proxy import parse_range, stream_format
+
+SIZE = 1000
+
+
+def test_no_range_sends_the_whole_stream():
+    assert parse_range(None, SIZE) == (0, 999, False)
+    assert parse_range('', SIZE) == (0, 999, False)
+
+
+def test_closed_range():
+    assert parse_range('bytes=100-199', SIZE) == (100, 199, True)
+
+
+def test_open_range_runs_to_the_end():
+    assert parse_range('bytes=100-', SIZE) == (100, 999, True)
+
+
+def test_range_past_the_end_is_clamped():
+    assert parse_range('bytes=900-5000', SIZE) == (900, 999, True)
+
+
+def test_suffix_range():
+    assert parse_range('bytes=-100', SIZE) == (900, 999, True)
+    assert parse_range('bytes=-5000', SIZE) == (0, 999, True)
+
+
+def test_reversed_range_is_ignored():
+    assert parse_range('bytes=500-100', SIZE) == (0, 999, False)
+
+
+def test_malformed_ranges_are_ignored():
+    assert parse_range('bytes=-', SIZE) == (0, 999, False)
+    assert parse_range('items=0-10', SIZE) == (0, 999, False)
+    assert parse_range('bytes=0-10,20-30', SIZE) == (0, 999, False)
+
+
+def test_unsatisfiable_ranges():
+    assert parse_range('bytes=1000-', SIZE) is None
+    assert parse_range('bytes=-0', SIZE) is None
+
+
+def test_stream_format_reads_the_itag():
+    assert stream_format('https://rr1.googlevideo.com/videoplayback?expire=1&itag=251&mime=audio') == '251'
+    assert stream_format('http://127.0.0.1/file.m4a') is None
@@ -0,0 +1,115 @@
+from playqueue import REPEAT_ALL, REPEAT_ONE, PlayQueue
+
+
+def make_queue(*video_ids, index=-1):
+    queue = PlayQueue()
+    for video_id in video_ids:
+        queue.enqueue(video_id, video_id.upper())
+    queue.index = index
+    return queue
+
+
+def ids(queue):
+    return [video_id for video_id, title in queue.tracks]
+
+
+def test_advance_walks_the_queue_and_stops_at_the_end():
+    queue = make_queue('a', 'b')
+    assert queue.advance() == ('a', 'A')
+    assert queue.advance() == ('b', 'B')
+    assert queue.advance() is None
+    assert queue.current() == ('b', 'B')
+
+
+def test_repeat_modes():
+    queue = make_queue('a', 'b', index=1)
+    queue.repeat = REPEAT_ALL
+    assert queue.peek_next() == ('a', 'A')
+    queue.repeat = REPEAT_ONE
+    assert queue.peek_next() == ('b', 'B')
+
+
+def test_play_next_and_play_now_insert_after_the_current_track():
+    queue = make_queue('a', 'b', index=0)
+    queue.play_next('x', 'X')
+    assert ids(queue) == ['a', 'x', 'b']
+    assert queue.play_now('y', 'Y') == ('y', 'Y')
+    assert ids(queue) == ['a', 'y', 'x', 'b']
+    assert queue.index == 1
+
+
+def test_remove_before_the_current_track_keeps_it_current():
+    queue = make_queue('a', 'b', 'c', index=2)
+    queue.remove(0)
+    assert queue.current() == ('c', 'C')
+
+
+def test_remove_after_the_current_track_keeps_it_current():
+    queue = make_queue('a', 'b', 'c', index=0)
+    queue.remove(2)
+    assert queue.current() == ('a', 'A')
+
+
+def test_removing_the_current_track_leaves_nothing_current():
+    queue = make_queue('a', 'b', 'c', index=1)
+    queue.remove(1)
+    assert queue.current() is None
+    # Playback carries on with the track that followed the removed one
+    assert queue.peek_next() == ('c', 'C')
+    assert queue.advance() == ('c', 'C')
+    assert not queue.detached
+
+
+def test_removing_the_first_and_current_track():
+    queue = make_queue('a', 'b', index=0)
+    queue.remove(0)
+    assert queue.current() is None
+    assert queue.advance() == ('b', 'B')
+
+
+def test_repeat_one_moves_on_once_the_current_track_is_removed():
+    queue = make_queue('a', 'b', 'c', index=1)
+    queue.repeat = REPEAT_ONE
+    queue.remove(1)
+    assert queue.peek_next() == ('c', 'C')
+
+
+def test_remove_ignores_positions_outside_the_queue():
+    queue = make_queue('a', index=0)
+    queue.remove(5)
+    queue.remove(-1)
+    assert ids(queue) == ['a']
+    assert queue.current() == ('a', 'A')
+
+
+def test_move_follows_the_current_track():
+    queue = make_queue('a', 'b', 'c', index=0)
+    queue.move(0, 2)
+    assert ids(queue) == ['b', 'c', 'a']
+    assert queue.current() == ('a', 'A')
+    queue.move(1, 0)
+    assert ids(queue) == ['c', 'b', 'a']
+    assert queue.current() == ('a', 'A')
+
+
+def test_move_across_the_current_track_shifts_its_index():
+    queue = make_queue('a', 'b', 'c', index=1)
+    queue.move(0, 2)
+    assert queue.current() == ('b', 'B')
+    queue.move(2, 0)
+    assert queue.current() == ('b', 'B')
+
+
+def test_shuffle_only_reorders_upcoming_tracks():
+    queue = make_queue('a', 'b', 'c', 'd', 'e', index=1)
+    queue.set_shuffle(True)
+    assert ids(queue)[:2] == ['a', 'b']
+    assert sorted(ids(queue)[2:]) == ['c', 'd', 'e']
+    queue.enqueue('f', 'F')
+    assert ids(queue).index('f') > 1
+
+
+def test_jump_outside_the_queue_keeps_the_current_track():
+    queue = make_queue('a', 'b', index=0)
+    assert queue.jump(7) == ('a', 'A')
+    assert queue.jump(1) == ('b', 'B')
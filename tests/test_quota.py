@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import pytest
+
+from quota import QUOTA_TIMEZONE, QuotaBudget, QuotaExhausted
+
+
+def make_budget(tmp_path, now, daily_limit=10000):
+    budget = QuotaBudget(path=str(tmp_path / 'quota.json'), daily_limit=daily_limit)
+    budget.now = lambda: now
+    return budget
+
+
+def at(hour, minute=0, day=1):
+    return datetime(2026, 3, day, hour, minute, tzinfo=QUOTA_TIMEZONE)
+
+
+def test_only_the_burst_share_is_available_at_midnight(tmp_path):
+    budget = make_budget(tmp_path, at(0))
+    assert budget.available() == 2000
+
+
+def test_the_rest_is_released_over_the_day(tmp_path):
+    assert make_budget(tmp_path, at(12)).available() == 7000
+    assert make_budget(tmp_path, at(23, 59)).available() == 10000
+
+
+def test_spending_beyond_the_paced_budget_is_refused(tmp_path):
+    budget = make_budget(tmp_path, at(0))
+    budget.spend(1900)
+    with pytest.raises(QuotaExhausted):
+        budget.spend(101)
+    assert budget.status()['spent'] == 1900
+
+
+def test_refund_returns_units(tmp_path):
+    budget = make_budget(tmp_path, at(6))
+    budget.spend(100)
+    budget.refund(100)
+    assert budget.status()['spent'] == 0
+
+
+def test_exhaust_uses_up_the_day(tmp_path):
+    budget = make_budget(tmp_path, at(6))
+    budget.exhaust()
+    assert budget.available() == 0
+    assert budget.low()
+
+
+def test_a_new_day_resets_the_ledger(tmp_path):
+    budget = make_budget(tmp_path, at(22))
+    budget.exhaust()
+    budget.now = lambda: at(1, day=2)
+    assert budget.status()['spent'] == 0
+    assert budget.available() > 0
+
+
+def test_the_ledger_survives_a_restart(tmp_path):
+    make_budget(tmp_path, at(6)).spend(300)
+    assert make_budget(tmp_path, at(7)).status()['spent'] == 300
@@ -0,0 +1,75 @@
+import os
+
+import net
+from disk_cache import DiskCache
+from metrics import metrics
+
+MAXRES_URL = 'https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg'
+THUMBNAIL_DIR = os.path.join('cache', 'thumbnails')
+THUMBNAIL_DISK_BUDGET = 100 * 1024 * 1024
+
+
+def configure(maxres_url=None):
+    global MAXRES_URL
+    if maxres_url is not None:
+        MAXRES_URL = maxres_url
+
+
+def fetch_thumbnail(video_id, fallback_url=None):
+    import requests
+    try:
+        response = net.get(MAXRES_URL.format(video_id=video_id))
+        response.raise_for_status()
+        return response.content
+    except requests.exceptions.RequestException:
+        pass
+    if not fallback_url:
+        return None
+    try:
+        response = net.get(fallback_url)
+        response.raise_for_status()
+        return response.content
+    except requests.exceptions.RequestException:
+        return None
+
+
+class ThumbnailDiskCache(DiskCache):
+    def __init__(self, directory=THUMBNAIL_DIR, max_bytes=THUMBNAIL_DISK_BUDGET, index=None):
+        super().__init__(directory, max_bytes)
+        if not self.restore(index):
+            self.scan()
+
+    def restore(self, index):
+        # A saved index is only trusted if nothing was added to or removed from the directory since
+        try:
+            if not index or index['mtime'] != os.stat(self.directory).st_mtime:
+                return False
+        except OSError:
+            return False
+        for video_id, size in index['entries']:
+            self.entries[video_id] = size
+            self.total_bytes += size
+        return True
+
+    def index(self):
+        with self.lock:
+            return {'mtime': os.stat(self.directory).st_mtime, 'entries': list(self.entries.items())}
+
+    def files(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.jpg'):
+                yield name[:-4], os.path.join(self.directory, name)
+
+    def path(self, video_id):
+        return os.path.join(self.directory, f'{video_id}.jpg')
+
+
+def load_thumbnail(video_id, fallback_url, disk_cache):
+    data = disk_cache.get(video_id)
+    metrics.cache_lookup('thumbnail', data is not None)
+    if data is None:
+        with metrics.timer('thumbnail_fetch'):
+            data = fetch_thumbnail(video_id, fallback_url)
+        if data:
+            disk_cache.put(video_id, data)
+    return data
@@ -0,0 +1,149 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+INDEX_FILE = os.path.join('cache', 'tracks.db')
+LOCAL_RESULTS = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    video_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    channel TEXT NOT NULL DEFAULT '',
+    duration INTEGER,
+    thumbnail_url TEXT,
+    play_count INTEGER NOT NULL DEFAULT 0,
+    last_played REAL,
+    last_seen REAL,
+    downloaded INTEGER NOT NULL DEFAULT 0,
+    loudness REAL,
+    category_id TEXT
+);
+"""
+
+# Columns added after the first release, created on indexes that predate them
+MIGRATIONS = (
+    'ALTER TABLE tracks ADD COLUMN loudness REAL',
+    'ALTER TABLE tracks ADD COLUMN category_id TEXT',
+)
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(title, channel, content='tracks', content_rowid='rowid');
+CREATE TRIGGER IF NOT EXISTS tracks_ai AFTER INSERT ON tracks BEGIN
+    INSERT INTO tracks_fts(rowid, title, channel) VALUES (new.rowid, new.title, new.channel);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_ad AFTER DELETE ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, title, channel) VALUES ('delete', old.rowid, old.title, old.channel);
+END;
+CREATE TRIGGER IF NOT EXISTS tracks_au AFTER UPDATE OF title, channel ON tracks BEGIN
+    INSERT INTO tracks_fts(tracks_fts, rowid, title, channel) VALUES ('delete', old.rowid, old.title, old.channel);
+    INSERT INTO tracks_fts(rowid, title, channel) VALUES (new.rowid, new.title, new.channel);
+END;
+"""
+
+COLUMNS = 'tracks.video_id, tracks.title, tracks.channel, tracks.thumbnail_url, tracks.duration, tracks.play_count'
+
+
+def match_expression(query):
+    # Every word must match, the last one as a prefix so partially typed words still hit
+    tokens = re.findall(r'\w+', query.lower())
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"' for token in tokens[:-1]) + f' "{tokens[-1]}"*'
+
+
+class TrackIndex:
+    def __init__(self, path=INDEX_FILE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        for migration in MIGRATIONS:
+            try:
+                self.connection.execute(migration)
+            except sqlite3.OperationalError:
+                pass
+        try:
+            created = not self.connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'tracks_fts'").fetchone()
+            self.connection.executescript(FTS_SCHEMA)
+            if created:
+                # Tracks indexed before full-text search existed
+                self.connection.execute("INSERT INTO tracks_fts(tracks_fts) VALUES ('rebuild')")
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5; fall back to LIKE matching
+            self.fts = False
+        self.connection.commit()
+
+    def add_results(self, results):
+        now = time.time()
+        rows = [
+            (result['video_id'], result['title'], result.get('channel', ''), result.get('thumbnail_url'), result.get('duration'), result.get('category_id'), now)
+            for result in results
+        ]
+        with self.lock, self.connection:
+            self.connection.executemany("""
+                INSERT INTO tracks (video_id, title, channel, thumbnail_url, duration, category_id, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET title = excluded.title, channel = excluded.channel,
+                    thumbnail_url = excluded.thumbnail_url, duration = coalesce(excluded.duration, duration),
+                    category_id = coalesce(excluded.category_id, category_id), last_seen = excluded.last_seen
+            """, rows)
+
+    def update_track(self, video_id, title, duration=None):
+        with self.lock, self.connection:
+            self.connection.execute("""
+                INSERT INTO tracks (video_id, title, duration) VALUES (?, ?, ?)
+                ON CONFLICT(video_id) DO UPDATE SET title = excluded.title, duration = coalesce(excluded.duration, duration)
+            """, (video_id, title, duration))
+
+    def record_play(self, video_id, title):
+        with self.lock, self.connection:
+            self.connection.execute("""
+                INSERT INTO tracks (video_id, title, play_count, last_played) VALUES (?, ?, 1, ?)
+                ON CONFLICT(video_id) DO UPDATE SET play_count = play_count + 1, last_played = excluded.last_played
+            """, (video_id, title, time.time()))
+
+    def mark_downloaded(self, video_id, title):
+        with self.lock, self.connection:
+            self.connection.execute("""
+                INSERT INTO tracks (video_id, title, downloaded) VALUES (?, ?, 1)
+                ON CONFLICT(video_id) DO UPDATE SET downloaded = 1
+            """, (video_id, title))
+
+    def loudness(self, video_id):
+        with self.lock:
+            row = self.connection.execute('SELECT loudness FROM tracks WHERE video_id = ?', (video_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_loudness(self, video_id, loudness):
+        with self.lock, self.connection:
+            self.connection.execute('UPDATE tracks SET loudness = ? WHERE video_id = ?', (loudness, video_id))
+
+    def search(self, query, limit=LOCAL_RESULTS):
+        if self.fts:
+            expression = match_expression(query)
+            if expression is None:
+                return []
+            sql = f"""
+                SELECT {COLUMNS} FROM tracks_fts JOIN tracks ON tracks.rowid = tracks_fts.rowid
+                WHERE tracks_fts MATCH ? ORDER BY tracks.play_count DESC, bm25(tracks_fts) LIMIT ?
+            """
+            params = (expression, limit)
+        else:
+            pattern = f'%{query.strip()}%'
+            sql = f'SELECT {COLUMNS} FROM tracks WHERE title LIKE ? OR channel LIKE ? ORDER BY play_count DESC LIMIT ?'
+            params = (pattern, pattern, limit)
+        with self.lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        return [
+            {'title': title, 'video_id': video_id, 'thumbnail_url': thumbnail_url, 'channel': channel, 'duration': duration, 'play_count': play_count, 'local': True}
+            for video_id, title, channel, thumbnail_url, duration, play_count in rows
+        ]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
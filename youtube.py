@@ -0,0 +1,118 @@
+import html
+import re
+
+import net
+from metrics import metrics
+from quota import QuotaExhausted
+
+API_URL = 'https://www.googleapis.com/youtube/v3'
+SEARCH_URL = f'{API_URL}/search'
+VIDEOS_URL = f'{API_URL}/videos'
+# Quota units charged per call against the API key's daily allowance
+SEARCH_COST = 100
+VIDEOS_COST = 1
+# search.list costs the same at any page size, so each call asks for the most it can
+SEARCH_PAGE_SIZE = 50
+# YouTube's "Music" category; the filter asks the API for it instead of guessing from titles
+MUSIC_CATEGORY_ID = '10'
+# videos.list accepts at most 50 IDs per call
+VIDEOS_BATCH_SIZE = 50
+# Field masks: only what is displayed or indexed comes back over the wire
+SEARCH_FIELDS = 'nextPageToken,items(id/videoId,snippet(title,channelTitle,thumbnails/high/url))'
+VIDEOS_FIELDS = 'items(id,snippet(title,channelTitle,categoryId,thumbnails(high/url,default/url)),contentDetails/duration)'
+DURATION_PATTERN = re.compile(r'P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?')
+
+
+def configure(api_url=None):
+    # Points the client at another Data API host, e.g. the local stand-in used by the benchmarks
+    global API_URL, SEARCH_URL, VIDEOS_URL
+    if api_url is not None:
+        API_URL = api_url.rstrip('/')
+        SEARCH_URL = f'{API_URL}/search'
+        VIDEOS_URL = f'{API_URL}/videos'
+
+
+def call(url, params, cost, budget, phase):
+    if budget is not None:
+        budget.spend(cost)
+    try:
+        with metrics.timer(phase):
+            response = net.get(url, params=params)
+    except Exception:
+        # The request never reached the API, so it cost nothing
+        if budget is not None:
+            budget.refund(cost)
+        raise
+    data = response.json()
+    metrics.increment('youtube_quota_units', cost)
+    error = data.get('error')
+    if error:
+        reasons = {detail.get('reason') for detail in error.get('errors', [])}
+        if reasons & {'quotaExceeded', 'dailyLimitExceeded'}:
+            if budget is not None:
+                budget.exhaust()
+            raise QuotaExhausted(error.get('message', 'YouTube API quota exceeded'))
+        raise RuntimeError(error.get('message', 'YouTube API error'))
+    return data
+
+
+def search(api_key, query, filter_enabled, page_token=None, budget=None):
+    params = {
+        'part': 'snippet',
+        'type': 'video',
+        'maxResults': SEARCH_PAGE_SIZE,
+        'q': query,
+        'fields': SEARCH_FIELDS,
+        'key': api_key,
+    }
+    if filter_enabled:
+        params['videoCategoryId'] = MUSIC_CATEGORY_ID
+    if page_token:
+        params['pageToken'] = page_token
+    data = call(SEARCH_URL, params, SEARCH_COST, budget, 'youtube_search')
+    results = []
+    for item in data.get('items', []):
+        snippet = item['snippet']
+        results.append({
+            'title': html.unescape(snippet['title']),
+            'video_id': item['id']['videoId'],
+            'thumbnail_url': snippet['thumbnails']['high']['url'],
+            'channel': html.unescape(snippet.get('channelTitle', '')),
+        })
+    return {'items': results, 'next_page_token': data.get('nextPageToken')}
+
+
+def parse_duration(value):
+    match = DURATION_PATTERN.fullmatch(value or '')
+    if not match:
+        return None
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def videos(api_key, video_ids, budget=None):
+    details = {}
+    video_ids = list(dict.fromkeys(video_ids))
+    for start in range(0, len(video_ids), VIDEOS_BATCH_SIZE):
+        params = {
+            'part': 'snippet,contentDetails',
+            'id': ','.join(video_ids[start:start + VIDEOS_BATCH_SIZE]),
+            'maxResults': VIDEOS_BATCH_SIZE,
+            'fields': VIDEOS_FIELDS,
+            'key': api_key,
+        }
+        data = call(VIDEOS_URL, params, VIDEOS_COST, budget, 'youtube_videos')
+        for item in data.get('items', []):
+            snippet = item['snippet']
+            thumbnails = snippet.get('thumbnails', {})
+            thumbnail = thumbnails.get('high') or thumbnails.get('default') or {}
+            # Unlike search.list, videos.list returns titles as plain text
+            details[item['id']] = {
+                'title': snippet['title'],
+                'video_id': item['id'],
+                'thumbnail_url': thumbnail.get('url'),
+                'channel': snippet.get('channelTitle', ''),
+                'category_id': snippet.get('categoryId'),
+                'duration': parse_duration(item.get('contentDetails', {}).get('duration')),
+            }
+    return details
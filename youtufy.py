@@ -0,0 +1,143 @@
+import startup
+import argparse
+import json
+import socket
+import socketserver
+import sys
+import threading
+
+startup.mark('imports')
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 7755
+
+# Socket command -> Engine method
+COMMANDS = {
+    'search': 'search',
+    'local': 'search_local',
+    'resolve': 'resolve',
+    'resolve_many': 'resolve_many',
+    'enqueue': 'enqueue',
+    'import': 'import_collection',
+    'queue': 'queue_state',
+    'play': 'play',
+    'pause': 'pause',
+    'resume': 'resume',
+    'next': 'next',
+    'stop': 'stop',
+    'volume': 'set_volume',
+    'seek': 'seek',
+    'status': 'status',
+    'metrics': 'metrics',
+    'quota': 'quota_status',
+}
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                command = request['command']
+                if command == 'shutdown':
+                    self.reply({'ok': True, 'result': None})
+                    threading.Thread(target=self.server.shutdown).start()
+                    return
+                if command not in COMMANDS:
+                    raise ValueError(f'unknown command: {command}')
+                result = getattr(self.server.engine, COMMANDS[command])(**request.get('args', {}))
+                self.reply({'ok': True, 'result': result})
+            except Exception as e:
+                self.reply({'ok': False, 'error': str(e)})
+
+    def reply(self, response):
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+        self.wfile.flush()
+
+
+class CommandServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, engine):
+        super().__init__(address, CommandHandler)
+        self.engine = engine
+
+
+def serve(host, port):
+    from engine import Engine
+    engine = Engine()
+    startup.mark('engine')
+    with CommandServer((host, port), engine) as server:
+        startup.mark('listening')
+        print(f'YouTufy engine listening on {host}:{port}')
+        if startup.enabled():
+            print(startup.report())
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    engine.close()
+
+
+def send(host, port, command, args):
+    with socket.create_connection((host, port)) as connection:
+        connection.sendall(json.dumps({'command': command, 'args': args}).encode() + b'\n')
+        response = connection.makefile().readline()
+    return json.loads(response)
+
+
+def parse_args(pairs):
+    # key=value is always a string, so video IDs made of digits stay IDs; key:=value is parsed as JSON
+    args = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        if key.endswith(':'):
+            args[key[:-1]] = json.loads(value)
+        else:
+            args[key] = value
+    return args
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='youtufy', description='Headless YouTufy engine')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--startup-report', action='store_true', help='print where startup time went')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search_parser = commands.add_parser('search', help='search YouTube and print the results')
+    search_parser.add_argument('query', nargs='+')
+    search_parser.add_argument('--no-filter', action='store_true', help='disable the music filter')
+
+    commands.add_parser('serve', help='run the engine and accept commands on a local socket')
+
+    send_parser = commands.add_parser('send', help='send a command to a running engine')
+    send_parser.add_argument('name', choices=sorted(COMMANDS) + ['shutdown'])
+    send_parser.add_argument('args', nargs='*', help='key=value string arguments, or key:=value for JSON values such as numbers, booleans and lists')
+
+    options = parser.parse_args(argv)
+    if options.command == 'serve':
+        serve(options.host, options.port)
+    elif options.command == 'send':
+        response = send(options.host, options.port, options.name, parse_args(options.args))
+        print(json.dumps(response, indent=2))
+        return 0 if response.get('ok') else 1
+    elif options.command == 'search':
+        from engine import Engine
+        engine = Engine()
+        startup.mark('engine')
+        page = engine.search(' '.join(options.query), not options.no_filter)
+        startup.mark('first results')
+        for result in page['items']:
+            print(f"{result['video_id']}  {result['title']}")
+        if startup.enabled():
+            print(startup.report())
+        engine.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())